@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+#
+# ---------------------------------------
+#   程序：match_data_bench.py
+#   版本：0.1
+#   作者：lds
+#   日期：2026-10-18
+#   语言：Python 3.X
+#   说明：ilds.match_data 的性能测试，使用固定随机种子生成的歌曲数据
+# ---------------------------------------
+
+"""
+测试 cleaning_data、match_data、add_duplicate_tags、check_duplicate_content、fill_in_the_matched_data 的运行时间，
+结果是 JSON 格式，方便比较不同版本的性能
+
+在项目根目录运行，没有安装 ilds（pip install -e .）的时候需要设置 PYTHONPATH=.，
+Windows 使用 set PYTHONPATH=. 以后再运行
+
+例子：
+PYTHONPATH=. python benchmarks/match_data_bench.py
+PYTHONPATH=. python benchmarks/match_data_bench.py --sizes 10000 100000 --output bench.json
+PYTHONPATH=. python benchmarks/match_data_bench.py --entries match_data add_duplicate_tags --no-memory
+"""
+
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import contextlib
+
+import numpy
+import pandas
+
+from ilds.versions import version
+from ilds.util import CLEAN_STR
+from ilds.match_data import (cleaning_data, match_data, add_duplicate_tags, check_duplicate_content,
+                             fill_in_the_matched_data)
+
+DEFAULT_SIZES = [10000, 100000, 1000000, 5000000]
+
+# 生成歌曲名和表演者用的常用汉字
+CHINESE_CHARS = ('爱你我的心中天空星月光夜雨风花雪海梦想时间永远回忆青春故事相遇离别温柔城市远方歌声'
+                 '快乐孤单等待思念世界自由飞翔阳光微笑眼泪幸福晚安朋友家乡春夏秋冬山河岁月人生旅行')
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何林罗高郑梁谢宋唐许韩冯邓曹彭曾'
+SUFFIXES = ['', '', '', '(Live)', '（伴奏）', ' Remix', 'DJ版', '【纯音乐】']
+PERFORMER_SEPARATORS = ['/', '、', '&', ' ', '|']
+
+
+def make_song_catalog(size, seed=0, duplicate_rate=0.2, dirty_rate=0.1, unique_titles=None):
+    """
+    生成歌曲数据
+
+    :param size: 行数
+    :param seed: 随机种子，相同的参数生成相同的数据
+    :param duplicate_rate: 重复行（清理以后相同）的比例
+    :param dirty_rate: 添加多余符号（CLEAN_STR 中的字符）的比例
+    :param unique_titles: 不重复的歌曲名数量，默认是行数的一半
+    :return: pandas.DataFrame，列：歌曲名称、表演者、歌曲ID、专辑名称
+    """
+    rng = numpy.random.default_rng(seed)
+    unique_titles = unique_titles or max(size // 2, 1)
+
+    chars = numpy.array(list(CHINESE_CHARS), dtype=object)
+    title_pool = pandas.Series(chars[rng.integers(0, len(chars), unique_titles)])
+    for _ in range(3):
+        extra = chars[rng.integers(0, len(chars), unique_titles)]
+        title_pool = title_pool + numpy.where(rng.random(unique_titles) < 0.7, extra, '')
+
+    names = pandas.Series(numpy.array(list(SURNAMES), dtype=object)[rng.integers(0, len(SURNAMES), unique_titles)])
+    names = names + chars[rng.integers(0, len(chars), unique_titles)] + chars[rng.integers(0, len(chars), unique_titles)]
+
+    title_index = rng.integers(0, unique_titles, size)
+    titles = title_pool.to_numpy()[title_index] + numpy.array(SUFFIXES, dtype=object)[rng.integers(0, len(SUFFIXES), size)]
+    performers = names.to_numpy()[title_index].copy()
+
+    # 一部分歌曲有多个表演者
+    multiple = rng.random(size) < 0.15
+    separators = numpy.array(PERFORMER_SEPARATORS, dtype=object)[rng.integers(0, len(PERFORMER_SEPARATORS), size)]
+    performers[multiple] = (performers + separators + names.to_numpy()[rng.integers(0, unique_titles, size)])[multiple]
+
+    df = pandas.DataFrame({
+        '歌曲名称': titles,
+        '表演者': performers,
+        '歌曲ID': (rng.integers(1, 10 ** 9, size)).astype(str).astype(object),
+        '专辑名称': numpy.char.add('专辑', (title_index % 5000).astype(str)).astype(object),
+    })
+
+    # 复制前面的行，作为重复的内容
+    duplicate = numpy.flatnonzero(rng.random(size) < duplicate_rate)
+    if len(duplicate):
+        source = (rng.random(len(duplicate)) * duplicate).astype(numpy.int64)
+        df.iloc[duplicate, :2] = df.iloc[source, :2].to_numpy()
+
+    # 添加多余符号，清理以后和原来的内容相同
+    dirty = rng.random(size) < dirty_rate
+    symbols = numpy.array(CLEAN_STR, dtype=object)[rng.integers(0, len(CLEAN_STR), size)]
+    df.loc[dirty, '歌曲名称'] = (symbols + df['歌曲名称'].to_numpy(dtype=object))[dirty]
+
+    return df
+
+
+def _prepare_source(df, check_columns):
+    """准备带“检查重复”列的数据源"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return cleaning_data(df, dropna_subset=check_columns, exists_subset=check_columns,
+                             astype_str_list=check_columns)['data']
+
+
+def get_entries(size, seed):
+    """
+    生成要测试的函数
+
+    :return: {名称: (准备函数, 测试函数)}，准备函数的结果传给测试函数，不计算时间
+    """
+    check_columns = ['歌曲名称', '表演者']
+    replace_columns = ['歌曲ID', '专辑名称']
+
+    def source():
+        return make_song_catalog(size, seed=seed)
+
+    def target():
+        return make_song_catalog(size, seed=seed + 1, unique_titles=max(size // 2, 1))
+
+    def prepared_pair():
+        return _prepare_source(source(), check_columns), target()
+
+    return {
+        'cleaning_data': (
+            source,
+            lambda df: cleaning_data(df, dropna_subset=check_columns, exists_subset=check_columns,
+                                     astype_str_list=check_columns)),
+        'match_data': (
+            prepared_pair,
+            lambda args: match_data(args[0], args[1], check_columns, replace_columns, is_digital=False)),
+        'add_duplicate_tags': (
+            prepared_pair,
+            lambda args: add_duplicate_tags(args[0], args[1], check_columns)),
+        'check_duplicate_content': (
+            lambda: {'Sheet1': source()},
+            lambda data: check_duplicate_content(data, check_columns)),
+        'fill_in_the_matched_data': (
+            lambda: (source(), {'Sheet1': target()}),
+            lambda args: fill_in_the_matched_data(args[0], args[1], check_columns, replace_columns)),
+    }
+
+
+def run_entry(prepare, func, memory=True):
+    """
+    运行一个测试
+
+    :return: (运行秒数, 内存峰值字节数)，不测试内存的时候内存峰值为 None
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        args = prepare()
+        start = time.perf_counter()
+        func(args)
+        seconds = time.perf_counter() - start
+
+        # tracemalloc 会影响运行时间，所以内存峰值单独运行一次
+        peak = None
+        if memory:
+            args = prepare()
+            tracemalloc.start()
+            func(args)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    return seconds, peak
+
+
+def run_benchmarks(sizes=None, entries=None, seed=0, memory=True, is_print=True):
+    """
+    运行性能测试
+
+    :param sizes: 测试的行数列表
+    :param entries: 要测试的函数名字列表，默认全部
+    :param seed: 随机种子
+    :param memory: 是否测试内存峰值
+    :param is_print: 打印每个测试的结果
+    :return: 测试结果字典
+    """
+    sizes = sizes or DEFAULT_SIZES
+    results = []
+    for size in sizes:
+        all_entries = get_entries(size, seed)
+        for name in entries or all_entries:
+            prepare, func = all_entries[name]
+            seconds, peak = run_entry(prepare, func, memory=memory)
+            result = {
+                'entry': name,
+                'rows': size,
+                'seconds': round(seconds, 4),
+                'rows_per_second': round(size / seconds, 1) if seconds else None,
+                'peak_memory_bytes': peak,
+            }
+            if is_print:
+                print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+            results.append(result)
+
+    return {
+        'meta': {
+            'ilds': version,
+            'python': platform.python_version(),
+            'pandas': pandas.__version__,
+            'numpy': numpy.__version__,
+            'platform': platform.platform(),
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ilds.match_data 性能测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='测试的行数')
+    parser.add_argument('--entries', nargs='+', default=None, help='要测试的函数名字')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--no-memory', action='store_true', help='不测试内存峰值')
+    parser.add_argument('--output', default=None, help='保存 JSON 结果的文件，默认输出到屏幕')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(sizes=args.sizes, entries=args.entries, seed=args.seed, memory=not args.no_memory)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
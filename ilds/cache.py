@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+#
+# ---------------------------------------
+#   程序：cache.py
+#   版本：0.1
+#   作者：lds
+#   日期：2026-10-18
+#   语言：Python 3.X
+#   说明：ilds 共用的缓存文件夹，限制总大小，按最后访问时间删除旧的缓存
+# ---------------------------------------
+
+"""
+所有的缓存（Excel 的 parquet 缓存、文件哈希缓存等）都保存在一个文件夹中，每种缓存使用一个子文件夹
+
+默认的文件夹是环境变量 ILDS_CACHE_DIR，没有设置的时候是 ~/.cache/ilds
+
+例子：
+from ilds.cache import get_cache_manager, set_cache_manager, CacheManager
+set_cache_manager(CacheManager('D:/ilds_cache', max_size=20 * 1024 ** 3))
+
+cache = get_cache_manager()
+cache_file = cache.get('excel', key, '.parquet')
+if cache_file is None:
+    cache_file = cache.path('excel', key, '.parquet')
+    df.to_parquet(cache_file)
+    cache.put('excel', key, '.parquet')
+print(cache.stats())
+"""
+
+import os
+import hashlib
+
+from ilds.log import get_logger
+
+logger = get_logger(__name__)
+
+# 默认的缓存总大小 10 GB
+DEFAULT_MAX_SIZE = 10 * 1024 ** 3
+
+# 元数据缓存（文件哈希、表格名字等）只在 namespaces 中统计，不计入总的命中和节省的字节数，
+# 避免和使用同一个源文件的数据缓存重复统计
+METADATA_NAMESPACES = ('hash', 'excel_meta')
+
+
+def get_default_cache_dir():
+    """获取默认的缓存文件夹"""
+    return os.environ.get('ILDS_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'ilds')
+
+
+def get_cache_key(*parts):
+    """
+    根据多个内容生成缓存的键
+
+    :param parts: 任意可以转换为字符串的内容
+    :return: MD5 字符串
+    """
+    hash_obj = hashlib.md5()
+    for part in parts:
+        hash_obj.update(str(part).encode('utf-8'))
+        hash_obj.update(b'\0')
+    return hash_obj.hexdigest()
+
+
+class CacheManager:
+    """
+    缓存文件夹管理
+
+    使用缓存的时候更新文件的修改时间（记录最后访问时间），保存缓存以后总大小超过 max_size 的时候，
+    删除最久没有使用的文件。总大小第一次保存的时候统计一次，以后只加上新的文件大小，超过 max_size 的时候才重新统计。
+    统计命中、未命中和节省的字节数（没有重新读取的源文件大小），每种缓存的统计在 namespaces 中
+    """
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+        """
+        :param cache_dir: 缓存文件夹，默认参考 get_default_cache_dir
+        :param max_size: 缓存总大小（字节），为 None 的时候不限制
+        """
+        self.cache_dir = cache_dir or get_default_cache_dir()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.namespaces = {}
+        # 估计的缓存总大小，None 的时候下次保存重新统计
+        self._size = None
+
+    def path(self, namespace, key, suffix=''):
+        """
+        获取缓存文件的路径（会创建子文件夹）
+
+        :param namespace: 缓存的种类，比如 'excel'、'hash'
+        :param key: 缓存的键，参考 get_cache_key
+        :param suffix: 文件后缀
+        :return: 文件路径
+        """
+        dir_path = os.path.join(self.cache_dir, namespace)
+        os.makedirs(dir_path, exist_ok=True)
+        return os.path.join(dir_path, f'{key}{suffix}')
+
+    def get(self, namespace, key, suffix='', source_size=0):
+        """
+        获取已经存在的缓存文件
+
+        :param source_size: 使用缓存节省的字节数（比如源文件的大小），用来统计
+        :return: 文件路径，不存在的时候返回 None
+        """
+        cache_file = os.path.join(self.cache_dir, namespace, f'{key}{suffix}')
+        if not os.path.exists(cache_file):
+            self.record(False, namespace=namespace)
+            return None
+
+        self.record(True, source_size, namespace=namespace)
+        self.touch(cache_file)
+        return cache_file
+
+    def record(self, hit, source_size=0, namespace=None):
+        """
+        记录一次命中或未命中（缓存内容需要检查以后才知道能不能使用的时候）
+
+        :param namespace: 缓存的种类，METADATA_NAMESPACES 中的缓存只在 namespaces 中统计
+        """
+        if namespace is not None:
+            counter = self.namespaces.setdefault(namespace, {'hits': 0, 'misses': 0, 'bytes_saved': 0})
+            if hit:
+                counter['hits'] += 1
+                counter['bytes_saved'] += source_size
+            else:
+                counter['misses'] += 1
+            if namespace in METADATA_NAMESPACES:
+                return
+
+        if hit:
+            self.hits += 1
+            self.bytes_saved += source_size
+        else:
+            self.misses += 1
+
+    @staticmethod
+    def touch(cache_file):
+        """更新最后访问时间"""
+        try:
+            # 修改时间作为最后访问时间，很多系统不更新 atime
+            os.utime(cache_file)
+        except OSError:
+            pass
+
+    def put(self, namespace, key, suffix=''):
+        """
+        登记已经写入的缓存文件，总大小超过限制的时候删除旧的缓存
+
+        :return: 文件路径
+        """
+        cache_file = os.path.join(self.cache_dir, namespace, f'{key}{suffix}')
+        if self.max_size is None:
+            return cache_file
+
+        # 覆盖已经存在的文件的时候估计值偏大，只会提前重新统计
+        if self._size is None:
+            self._size = self.size()
+        else:
+            try:
+                self._size += os.path.getsize(cache_file)
+            except OSError:
+                pass
+        if self._size > self.max_size:
+            self.evict(keep=cache_file)
+        return cache_file
+
+    def remove(self, namespace, key, suffix=''):
+        """删除一个缓存文件"""
+        cache_file = os.path.join(self.cache_dir, namespace, f'{key}{suffix}')
+        if os.path.exists(cache_file):
+            if self._size is not None:
+                self._size -= os.path.getsize(cache_file)
+            os.remove(cache_file)
+
+    def files(self):
+        """
+        获取所有的缓存文件
+
+        :return: [(最后访问时间, 大小, 文件路径), ...]
+        """
+        files = []
+        if not os.path.isdir(self.cache_dir):
+            return files
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                file = os.path.join(root, name)
+                try:
+                    st = os.stat(file)
+                except OSError:
+                    continue
+                files.append((st.st_mtime_ns, st.st_size, file))
+        return files
+
+    def size(self):
+        """缓存文件的总大小（字节）"""
+        return sum(size for _, size, _ in self.files())
+
+    def evict(self, max_size=None, keep=None):
+        """
+        删除最久没有使用的缓存，直到总大小不超过 max_size
+
+        :param max_size: 默认使用 self.max_size
+        :param keep: 不删除的文件（刚写入的缓存）
+        :return: 删除的文件数量
+        """
+        max_size = self.max_size if max_size is None else max_size
+        if max_size is None:
+            return 0
+
+        files = self.files()
+        total = sum(size for _, size, _ in files)
+        self._size = total
+        count = 0
+        for _, size, file in sorted(files):
+            if total <= max_size:
+                break
+            if keep is not None and os.path.abspath(file) == os.path.abspath(keep):
+                continue
+            try:
+                os.remove(file)
+            except OSError as e:
+                logger.warning('删除缓存失败: %s %s', file, e)
+                continue
+            logger.info('删除旧的缓存: %s', file)
+            total -= size
+            count += 1
+            self.evictions += 1
+            self.evicted_bytes += size
+        self._size = total
+        return count
+
+    def clear(self, namespace=None):
+        """删除全部的缓存，或者一种缓存"""
+        dir_path = self.cache_dir if namespace is None else os.path.join(self.cache_dir, namespace)
+        for _, _, file in CacheManager(dir_path, max_size=None).files():
+            os.remove(file)
+        self._size = None
+
+    def stats(self):
+        """缓存的统计信息"""
+        files = self.files()
+        return {
+            'cache_dir': self.cache_dir,
+            'files': len(files),
+            'size': sum(size for _, size, _ in files),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'bytes_saved': self.bytes_saved,
+            'evictions': self.evictions,
+            'evicted_bytes': self.evicted_bytes,
+            'namespaces': {namespace: dict(counter) for namespace, counter in self.namespaces.items()},
+        }
+
+    def __str__(self):
+        return f'缓存文件夹: {self.cache_dir}，命中: {self.hits}，未命中: {self.misses}，节省: {self.bytes_saved} 字节'
+
+
+_cache_manager = None
+
+
+def get_cache_manager():
+    """获取共用的 CacheManager，第一次使用的时候创建"""
+    global _cache_manager
+    if _cache_manager is None:
+        _cache_manager = CacheManager()
+    return _cache_manager
+
+
+def set_cache_manager(cache_manager):
+    """
+    设置共用的 CacheManager（修改缓存文件夹或大小限制）
+
+    :param cache_manager: CacheManager，为 None 的时候下次使用默认设置
+    :return: 以前的 CacheManager
+    """
+    global _cache_manager
+    old, _cache_manager = _cache_manager, cache_manager
+    return old
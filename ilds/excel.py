@@ -21,6 +21,7 @@ import xml.etree.ElementTree as ET
 import requests
 
 from ilds.file import get_dir_files
+from ilds.xlsx import probe_workbook
 
 from openpyxl import load_workbook, Workbook
 from openpyxl.styles import numbers, is_date_format
@@ -78,24 +79,25 @@ def get_excel_info(file, only_read_first_table=False):
 
     file_name = os.path.basename(file)
 
-    wb = load_workbook(file, read_only=True)
-    sheet_names = wb.sheetnames
+    # 直接从 XML 读取表格名字、状态、<dimension> 和第一行，不加载工作簿，公式和 load_workbook 一样返回公式
+    info = probe_workbook(file, data_only=False)
+    sheet_names = list(info)
 
-    for index, sheet_name in enumerate(sheet_names):
-        ws = wb[sheet_name]
-
-        # 获取第一行数据
-        columns = next(ws.iter_rows(min_row=1, max_row=1, values_only=True))
+    for sheet_name, sheet_info in info.items():
+        # 第一行的长度和 openpyxl 一样补齐到 max_column
+        columns = sheet_info['columns']
+        if sheet_info['max_column'] is not None:
+            columns = columns + [None] * (sheet_info['max_column'] - len(columns))
 
         df_data = {
             'file_name': file_name,
-            'index': index,
+            'index': sheet_info['index'],
             'sheet_name': sheet_name,
             'sheet_names': sheet_names,
-            'sheet_state': ws.sheet_state,
-            'max_row': ws.max_row,
-            'max_column': ws.max_column,
-            'columns': list(columns),
+            'sheet_state': sheet_info['sheet_state'],
+            'max_row': sheet_info['max_row'],
+            'max_column': sheet_info['max_column'],
+            'columns': columns,
 
         }
 
@@ -107,8 +109,6 @@ def get_excel_info(file, only_read_first_table=False):
 
         data[sheet_name] = df_data
 
-    wb.close()
-
     return data
 
 
@@ -20,6 +20,11 @@ from pathlib import Path
 
 from colorama import Fore, Back, Style
 
+from ilds.log import get_logger
+from ilds.cache import get_cache_manager, get_cache_key
+
+logger = get_logger(__name__)
+
 AFILES = []  # EE
 BFILES = []  # SVN
 COMMON = []  # EE & SVN
@@ -35,13 +40,13 @@ def is_file(file):
     :return:文件不存在，不是文件，大小为0，返回 None
     """
     if not os.path.exists(file):
-        print(file, ' 没有找到')
+        logger.info('%s  没有找到', file)
         return None
     if not os.path.isfile(file):
-        print(file, ' 不是文件')
+        logger.info('%s  不是文件', file)
         return None
     if os.path.getsize(file) == 0:
-        print(file, ' 大小为 0')
+        logger.info('%s  大小为 0', file)
         return None
 
     return file
@@ -156,6 +161,54 @@ def get_file_md5(file, block_size=65536):
     return md5_.hexdigest()
 
 
+def get_file_stat_key(file):
+    """
+    获取文件的 stat 指纹（大小、修改时间、inode），文件内容修改以后一般会变化，不需要读取文件内容
+
+    :param file: 文件路径
+    :return: {'size', 'mtime_ns', 'inode'}
+    """
+    st = os.stat(file)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'inode': st.st_ino}
+
+
+def get_file_md5_cached(file, sidecar_file=None, block_size=65536):
+    """
+    计算文件的 MD5，结果和 stat 指纹一起保存在旁边的小文件中
+
+    stat 指纹（参考 get_file_stat_key）和保存的相同的时候直接使用保存的 MD5，不读取文件内容，
+    不同的时候重新计算并保存。不能保存的时候（比如只读的文件夹）只返回计算结果
+
+    :param file: 文件路径
+    :param sidecar_file: 保存 MD5 的文件，默认保存在共用缓存文件夹的 hash 子文件夹中，参考 ilds.cache
+    :param block_size: 读取缓存大小
+    :return: MD5，文件不存在的时候返回 None
+    """
+    if not is_file(file):
+        return None
+
+    cache = None
+    if sidecar_file is None:
+        cache = get_cache_manager()
+        key = get_cache_key(os.path.abspath(file))
+        sidecar_file = cache.path('hash', key, '.json')
+
+    stat_key = get_file_stat_key(file)
+    if os.path.exists(sidecar_file):
+        sidecar = json_read(sidecar_file, raise_error=False) or {}
+        if sidecar.get('stat') == stat_key and sidecar.get('md5'):
+            if cache is not None:
+                cache.record(True, stat_key['size'], namespace='hash')
+                cache.touch(sidecar_file)
+            return sidecar['md5']
+
+    md5 = get_file_md5(file, block_size=block_size)
+    if json_save({'stat': stat_key, 'md5': md5}, sidecar_file, raise_error=False) and cache is not None:
+        cache.record(False, namespace='hash')
+        cache.put('hash', key, '.json')
+    return md5
+
+
 def get_hash_sums(file, names=None, block_size=65536):
     """
     获取文件的哈希信息
@@ -323,9 +376,9 @@ def file_string_replace(file, old, new, count=None):
             f_w.write(line)
 
     if counts:
-        print("在 %s 中替换了 %s 为 %s，总共 %s个" % (file, old, new, counts))
+        logger.info("在 %s 中替换了 %s 为 %s，总共 %s个", file, old, new, counts)
     else:
-        print("没有内容替换")
+        logger.info("没有内容替换")
 
 
 def exists_file(_file):
@@ -459,7 +512,7 @@ def from_dir_func(dir_path, func, prefix='.', suffix='', *args, **kwargs):
     fileno = 0
     info = []
     if os.path.isdir(dir_path):
-        print('\n处理路径：\n%s\n' % (dir_path))
+        logger.info('\n处理路径：\n%s\n', dir_path)
         for dirpath, dirnames, filenames in os.walk(dir_path):
             for _filename in filenames:
                 if prefix and _filename.startswith(prefix):
@@ -478,9 +531,9 @@ def from_dir_func(dir_path, func, prefix='.', suffix='', *args, **kwargs):
                     fileok += 1
                     info.append(func(_file, *args, **kwargs))
 
-        print(
-            ' ----------- 处理 %s 个文件（跳过名称前面是：“%s”，处理后缀：“%s”） ----------- 忽略 %s 个文件 ----------- ' % (
-                fileok, prefix, suffix, fileno))
+        logger.info(
+            ' ----------- 处理 %s 个文件（跳过名称前面是：“%s”，处理后缀：“%s”） ----------- 忽略 %s 个文件 ----------- ',
+            fileok, prefix, suffix, fileno)
     else:
         raise FileExistsError('请输入文件路径！')
     return info
@@ -491,7 +544,7 @@ def get_walk_files(dir_path, endswith=''):
     获取文件夹包括子文件夹里面的文件列表（生成器）
     """
     if os.path.isdir(dir_path):
-        print('\n处理路径：\n%s\n' % (dir_path))
+        logger.info('\n处理路径：\n%s\n', dir_path)
         for dirpath, dirnames, filenames in os.walk(dir_path):
             for _filename in filenames:
                 if _filename.startswith('.'):
@@ -539,7 +592,7 @@ def remove_empty_folders(path):
     """
 
     if not os.path.exists(path):
-        print(f"没有找到文件夹：'{path}'")
+        logger.info("没有找到文件夹：'%s'", path)
         return
 
     # 遍历文件夹中的所有文件和子文件夹，先处理最深的文件夹
@@ -550,17 +603,17 @@ def remove_empty_folders(path):
             if not os.listdir(dir_path):
                 try:
                     os.rmdir(dir_path)
-                    print(f"删除文件夹: {dir_path}")
+                    logger.info('删除文件夹: %s', dir_path)
                 except OSError as e:
-                    print(f"删除文件夹失败 {dir_path}: {e}")
+                    logger.warning('删除文件夹失败 %s: %s', dir_path, e)
 
     # 最后查看当前目录是否为空文件夹
     if not os.listdir(path):
         try:
             os.rmdir(path)
-            print(f"删除文件夹: {path}")
+            logger.info('删除文件夹: %s', path)
         except OSError as e:
-            print(f"删除文件夹失败 {path}: {e}")
+            logger.warning('删除文件夹失败 %s: %s', path, e)
 
 
 def dir_compare(apath, bpath, diff_ext=None, out_dir=None):
@@ -676,7 +729,7 @@ def dir_compare(apath, bpath, diff_ext=None, out_dir=None):
 
         # 文件不同的时候处理
         diff_info.append(info)
-        print(info)
+        logger.info(info)
 
     diff_file = os.path.join(out_dir, 'diff.txt')
     if os.path.exists(diff_file):
@@ -686,7 +739,7 @@ def dir_compare(apath, bpath, diff_ext=None, out_dir=None):
             di.write('\n'.join(diff_info))
     else:
         if diff_ext:
-            print(f'文件夹中的 {diff_ext} 后缀名文件没有差异')
+            logger.info('文件夹中的 %s 后缀名文件没有差异', diff_ext)
 
     # 处理仅出现在一个目录中的文件
     onlyFiles = setA ^ setB
@@ -727,8 +780,8 @@ def dir_compare(apath, bpath, diff_ext=None, out_dir=None):
                 # b.write(bpath + of + '\n')
             # print (of)
 
-    print(apath, 'only files numbers:', aonly_count)
-    print(bpath, 'only files numbers:', bonly_count)
+    logger.info('%s only files numbers: %s', apath, aonly_count)
+    logger.info('%s only files numbers: %s', bpath, bonly_count)
 
 
 def get_compound_file_binary(file):
@@ -783,7 +836,7 @@ def synch_git_files(src, dst, remove_src=False):
                 info = f'没有找到文件 {dst_file}'
             if is_copy:
                 count += 1
-                print(is_copy, info, )
+                logger.info('%s %s', is_copy, info)
 
                 dst_dir = os.path.dirname(dst_file)
                 if not os.path.exists(dst_dir):
@@ -811,15 +864,15 @@ def synch_git_files(src, dst, remove_src=False):
                 info = f'目的文件夹多的文件 {src_file}'
 
             if is_remove:
-                print(is_remove, info, )
+                logger.info('%s %s', is_remove, info)
                 if remove_src:
                     os.remove(src_file)
                 remove_count += 1
 
     if remove_src:
-        print(f'修改 {count} 删除 {remove_count}')
+        logger.info('修改 %s 删除 %s', count, remove_count)
     else:
-        print(f'修改 {count} 需要删除的文件 {remove_count}')
+        logger.info('修改 %s 需要删除的文件 %s', count, remove_count)
 
 
 def json_read(path, raise_error=True):
@@ -833,7 +886,7 @@ def json_read(path, raise_error=True):
         if raise_error:
             raise
         else:
-            print('Error reading JSON:', e)
+            logger.warning('Error reading JSON: %s', e)
             return None
 
 
@@ -852,7 +905,7 @@ def json_save(obj, path, indent=2, raise_error=True):
         if raise_error:
             raise
         else:
-            print('Error saving JSON:', e)
+            logger.warning('Error saving JSON: %s', e)
             return False
 
 
@@ -881,7 +934,7 @@ def load_pickle(file_path):
 
 def open_file(file_path):
     if not os.path.exists(file_path):
-        print("文件不存在，请检查路径。")
+        logger.info("文件不存在，请检查路径。")
         return
 
     system_name = platform.system()
@@ -894,9 +947,9 @@ def open_file(file_path):
         elif system_name == 'Linux':
             subprocess.run(['xdg-open', file_path], check=True)
         else:
-            print(f"不支持的操作系统: {system_name}")
+            logger.warning('不支持的操作系统: %s', system_name)
     except Exception as e:
-        print(f"无法打开文件: {e}")
+        logger.warning('无法打开文件: %s', e)
 
 
 def doc():
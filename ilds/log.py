@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# ---------------------------------------
+#   程序：log.py
+#   版本：0.1
+#   作者：lds
+#   日期：2026-10-18
+#   语言：Python 3.X
+#   说明：ilds 共用的日志，match_data、ilds.pd、ilds.file 的信息都使用这里的 logger 输出
+# ---------------------------------------
+
+"""
+默认和以前的 print 一样输出到屏幕（INFO），可以用 set_verbosity 修改所有模块的输出级别
+
+日志的参数在输出的时候才格式化，不输出的内容不会格式化：
+logger.debug('转换后的内容：\n%s', series)
+
+例子：
+from ilds.log import set_verbosity, verbosity
+set_verbosity('quiet')  # 服务器上只输出警告和错误
+set_verbosity('debug')  # 调试的时候输出全部内容，包括转换后的整列数据
+
+with verbosity('quiet'):
+    fill_in_the_matched_data(...)
+"""
+
+import sys
+import logging
+from contextlib import contextmanager
+
+LOGGER_NAME = 'ilds'
+
+VERBOSITY_LEVELS = {
+    'quiet': logging.WARNING,
+    'info': logging.INFO,
+    'debug': logging.DEBUG,
+}
+
+
+class StdoutHandler(logging.StreamHandler):
+    """输出到当前的 sys.stdout（和 print 相同，contextlib.redirect_stdout 也可以使用）"""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+logger = logging.getLogger(LOGGER_NAME)
+if not logger.handlers:
+    _handler = StdoutHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def get_logger(name):
+    """
+    获取模块的 logger，使用 ilds 的输出级别
+
+    :param name: 模块名字，比如 __name__
+    :return: logging.Logger
+    """
+    if name != LOGGER_NAME and not name.startswith(LOGGER_NAME + '.'):
+        name = f'{LOGGER_NAME}.{name}'
+    return logging.getLogger(name)
+
+
+def get_level(level):
+    """
+    转换输出级别
+
+    :param level: 'quiet'、'info'、'debug'，True（info）、False（quiet）或者 logging 的级别
+    :return: logging 的级别
+    """
+    if level is True:
+        return logging.INFO
+    if level is False or level is None:
+        return logging.WARNING
+    if isinstance(level, str):
+        if level.lower() not in VERBOSITY_LEVELS:
+            raise ValueError(f'不支持的输出级别: {level}，可以使用: {list(VERBOSITY_LEVELS)}')
+        return VERBOSITY_LEVELS[level.lower()]
+    return level
+
+
+def set_verbosity(level):
+    """
+    设置 ilds 所有模块的输出级别
+
+    :param level: 参考 get_level
+    :return: 以前的级别
+    """
+    old_level = logger.level
+    logger.setLevel(get_level(level))
+    return old_level
+
+
+@contextmanager
+def verbosity(level):
+    """临时修改输出级别"""
+    old_level = set_verbosity(level)
+    try:
+        yield
+    finally:
+        logger.setLevel(old_level)
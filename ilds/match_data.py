@@ -11,19 +11,46 @@
 
 
 import os
+import re
+import sys
+import json
+import math
+import time
+import sqlite3
+import hashlib
 from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块，不统计内存
+    resource = None
 
 """
 我们为了在服务器使用匹配结果，大部分函数返回结果是：{'infos': infos, 'data': data} 或者 {'infos': infos, 'data': df}
+匹配相关的函数还会返回 'metrics'：MatchMetrics 统计信息
 """
 
 try:
+    import numpy
     import pandas
 except ImportError as e:
     raise ImportError("导入 pandas 失败，如果没有安装，请安装它: pip install pandas")
 
-from .util import cleaning_str, cleaning_digital
-from .pd import get_columns_index
+from .util import cleaning_str, get_str_cleaner, KeyCache, CLEAN_STR, REPLACE_LIST
+from .file import save_pickle, load_pickle
+from .pd import read_file_chunks, ChunkWriter
+from .log import get_logger
+from .cache import CacheManager, get_cache_manager
+
+logger = get_logger(__name__)
+
+# 修改 MatchIndex 保存的内容以后需要修改版本，让以前的缓存失效
+MATCH_INDEX_VERSION = 1
+# 修改增量匹配保存的状态以后需要修改版本
+MATCH_STATE_VERSION = 1
 
 
 def get_exists_dup(array_like, *args):
@@ -34,6 +61,228 @@ def get_exists_dup(array_like, *args):
     return cleaning_str(exists_dup)
 
 
+def get_peak_memory():
+    """获取进程的内存峰值（字节），不支持的系统返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 的单位是字节，Linux 是 KB
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MatchMetrics:
+    """
+    匹配过程的统计信息：每个步骤的运行时间、内存峰值增加和计数
+
+    只记录时间和计数，可以一直开启
+
+    例子：
+    metrics = MatchMetrics()
+    with metrics.stage('match_data.lookup'):
+        ...
+    metrics.count('match_data.hit', 100)
+    print(metrics.to_dict())
+    """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        """统计一个步骤，相同名字的步骤累加"""
+        start = time.perf_counter()
+        start_memory = get_peak_memory()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'peak_memory_delta': None})
+            stage['seconds'] += time.perf_counter() - start
+            stage['calls'] += 1
+            if start_memory is not None:
+                stage['peak_memory_delta'] = (stage['peak_memory_delta'] or 0) + get_peak_memory() - start_memory
+
+    def count(self, name, value=1):
+        """增加计数"""
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def merge(self, other):
+        """合并其他的统计信息（比如多进程的结果）"""
+        for name, other_stage in other.stages.items():
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'peak_memory_delta': None})
+            stage['seconds'] += other_stage['seconds']
+            stage['calls'] += other_stage['calls']
+            if other_stage['peak_memory_delta'] is not None:
+                stage['peak_memory_delta'] = (stage['peak_memory_delta'] or 0) + other_stage['peak_memory_delta']
+        for name, value in other.counters.items():
+            self.count(name, value)
+        return self
+
+    def to_dict(self):
+        """转换为字典，方便保存为 JSON"""
+        return {
+            'stages': {name: dict(stage, seconds=round(stage['seconds'], 6)) for name, stage in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+    def __str__(self):
+        lines = [f'{name}: {stage["seconds"]:.3f} 秒（{stage["calls"]} 次）' for name, stage in self.stages.items()]
+        lines.extend(f'{name}: {value}' for name, value in self.counters.items())
+        return '\n'.join(lines)
+
+
+class ConflictReport:
+    """
+    匹配到的键有冲突内容（同一个键在数据源中有不同的填充内容）的汇总
+
+    按列和按键统计冲突的次数，只保存 max_examples 个文字例子，
+    keep_all 为 True 的时候保存全部的冲突内容，可以用 to_dataframe 导出
+
+    例子：
+    r = match_data(df1, df2, check_columns, replace_columns, is_digital=False, conflict_export=True)
+    print(r['conflicts'])
+    r['conflicts'].to_dataframe().to_excel('冲突.xlsx')
+    """
+
+    def __init__(self, max_examples=20, keep_all=False):
+        """
+        :param max_examples: 保存的文字例子数量
+        :param keep_all: 保存全部的冲突内容
+        """
+        self.max_examples = max_examples
+        self.keep_all = keep_all
+        self.total = 0
+        self.columns = {}
+        self.keys = {}
+        self.examples = []
+        self.details = {}
+
+    def add(self, key, key_conflicts, count=1):
+        """
+        添加一个键的冲突内容
+
+        :param key: 键
+        :param key_conflicts: [(列名, 内容), ...]
+        :param count: 这个键匹配到的次数
+        """
+        if not key_conflicts:
+            return
+        self.total += len(key_conflicts) * count
+        self.keys[key] = self.keys.get(key, 0) + len(key_conflicts) * count
+        for col, value in key_conflicts:
+            self.columns[col] = self.columns.get(col, 0) + count
+            if len(self.examples) < self.max_examples:
+                self.examples.append(f'重复（{col}）: {value}')
+            if self.keep_all:
+                detail = (key, col, value)
+                self.details[detail] = self.details.get(detail, 0) + count
+
+    def merge(self, other):
+        """合并其他的冲突汇总（比如其他表格的结果）"""
+        self.total += other.total
+        for col, count in other.columns.items():
+            self.columns[col] = self.columns.get(col, 0) + count
+        for key, count in other.keys.items():
+            self.keys[key] = self.keys.get(key, 0) + count
+        self.examples.extend(other.examples[:max(self.max_examples - len(self.examples), 0)])
+        for detail, count in other.details.items():
+            self.details[detail] = self.details.get(detail, 0) + count
+        return self
+
+    def __len__(self):
+        return self.total
+
+    def to_dataframe(self):
+        """
+        导出冲突内容
+
+        :return: DataFrame 列：键、列、内容、次数，keep_all 为 False 的时候只有按键的次数
+        """
+        if self.keep_all:
+            return pandas.DataFrame([(key, col, value, count) for (key, col, value), count in self.details.items()],
+                                    columns=['键', '列', '内容', '次数'])
+        return pandas.DataFrame(list(self.keys.items()), columns=['键', '次数'])
+
+    def __str__(self):
+        columns = '，'.join(f'{col}: {count}' for col, count in self.columns.items())
+        return f'冲突数量: {self.total}（{columns}），冲突的键: {len(self.keys)}'
+
+
+def get_key_cache(key_cache):
+    """
+    获取检查重复内容的缓存
+
+    :param key_cache: None 或 False 不使用缓存，True 创建新的缓存，也可以是 KeyCache 对象（多次调用共用缓存）
+    :return: KeyCache 或 None
+    """
+    if key_cache is True:
+        return KeyCache()
+    if key_cache is None or key_cache is False:
+        return None
+    return key_cache
+
+
+def get_exists_dup_series(df, columns, replace_list=None, key_cache=None):
+    """
+    按列获取用来检查重复的内容，结果和每行使用 get_exists_dup 相同
+
+    整列一起处理：str.cat 合并内容，转为小写，替换内容，最后用 str.translate 一次清除全部符号
+    使用 key_cache 的时候，只清理不重复的内容
+
+    :param df: pandas.DataFrame
+    :param columns: 用来检查重复的列
+    :param replace_list: 替换指定的字符，默认使用 REPLACE_LIST
+    :param key_cache: KeyCache，使用缓存的时候忽略 replace_list
+    :return: pandas.Series
+    """
+    parts = []
+    for col in columns:
+        try:
+            parts.append(df[col].str.strip())
+        except AttributeError as e:
+            raise ValueError(f'“{col}” 列的内容不是字符串 {e}')
+
+    text = parts[0].str.cat(parts[1:]) if len(parts) > 1 else parts[0]
+
+    # 不是字符串的内容 str 方法会返回空值，和 get_exists_dup 一样报错
+    if text.isna().any():
+        i = text.isna().to_numpy().argmax()
+        raise ValueError('%s 内容不是字符串' % [str(df[col].iloc[i]) for col in columns])
+
+    return normalize_series(text, replace_list, key_cache)
+
+
+def normalize_series(text, replace_list=None, key_cache=None):
+    """
+    按列清理字符中的多余符号，结果和每个内容使用 cleaning_str 相同
+
+    :param text: 内容是字符串的 pandas.Series
+    :param replace_list: 替换指定的字符，默认使用 REPLACE_LIST
+    :param key_cache: KeyCache，使用缓存的时候只清理不重复的内容，并且忽略 replace_list
+    :return: pandas.Series
+    """
+    if key_cache is not None:
+        codes, uniques = pandas.factorize(text)
+        normalized = numpy.array(key_cache.normalize_many(uniques), dtype=object)
+        return pandas.Series(normalized[codes], index=text.index, dtype=object)
+
+    cleaner = get_str_cleaner(replace_list)
+    text = text.str.strip().str.lower()
+    if cleaner.pattern is not None:
+        text = text.str.replace(cleaner.pattern, cleaner.repl, regex=True)
+    else:
+        for old, new in cleaner.replace_list:
+            text = text.str.replace(old, new, regex=False)
+    return text.str.translate(cleaner.table)
+
+
+def str_series(series):
+    """和 str() 一样把列的内容转换为字符串"""
+    if pandas.api.types.is_string_dtype(series) and not series.hasnans:
+        return series
+    return series.map(str)
+
+
 def get_digital_dup(array_like, *args):
     """
     获取用来检查的数字内容
@@ -44,88 +293,175 @@ def get_digital_dup(array_like, *args):
     try:
         return str(int(exists_dup.split('.')[0]))
     except Exception as e:
-        print(f'{exists_dup} {e}')
+        logger.warning('%s %s', exists_dup, e)
     return ''
 
 
+def aggregate_multiple_results(df, replace_columns, key_column='检查重复', unique=False, sep='|'):
+    """
+    合并相同“检查重复”内容的多个结果
+
+    每个键保留第一次出现的行，要填充的列用 sep 连接这个键的全部内容（按出现的顺序）
+
+    :param df: pandas.DataFrame
+    :param replace_columns: 要合并的列
+    :param key_column: 用来分组的列
+    :param unique: 合并的时候去掉同一个键中重复的内容
+    :param sep: 连接符
+    :return: 合并以后的 pandas.DataFrame
+    """
+    keys = df[key_column]
+    result = df[~keys.duplicated(keep='first').to_numpy()].reset_index(drop=True)
+
+    duplicated = keys.duplicated(keep=False).to_numpy()
+    if not duplicated.any():
+        return result
+
+    if unique:
+        def join(values):
+            return sep.join(dict.fromkeys(values))
+    else:
+        join = sep.join
+
+    df_dup = df[duplicated]
+    grouped = df_dup.assign(**{col: str_series(df_dup[col]) for col in replace_columns}).groupby(key_column, sort=False, dropna=False)
+    for col in replace_columns:
+        joined = grouped[col].agg(join)
+        positions = joined.index.get_indexer(result[key_column])
+        found = positions >= 0
+        column_values = result[col].to_numpy(dtype=object, copy=True)
+        column_values[found] = joined.to_numpy(dtype=object)[positions[found]]
+        result[col] = column_values
+
+    return result
+
+
+def get_digital_dup_series(series):
+    """
+    按列获取用来检查的数字内容，结果和每行使用 get_digital_dup 相同
+
+    普通的整数和小数整列一起转换，其他内容再单独用 int() 转换，不能转换的内容返回空字符串
+
+    :param series: pandas.Series
+    :return: (pandas.Series, invalid) invalid 是不能转换的行的 numpy 布尔数组
+    """
+    text = str_series(series).str.strip()
+    head = text.str.split('.', n=1).str[0]
+
+    # 普通的整数一起转换，去掉正负号后面的 0，结果和 str(int()) 相同
+    parts = head.str.extract(r'^\s*([+-]?)([0-9]+)\s*$')
+    sign = parts[0].to_numpy(dtype=object)
+    digits = parts[1].str.lstrip('0').replace('', '0').to_numpy(dtype=object)
+    matched = ~pandas.isna(digits)
+    keys = numpy.full(len(text), '', dtype=object)
+    negative = matched & (sign == '-') & (digits != '0')
+    keys[matched] = digits[matched]
+    keys[negative] = '-' + digits[negative]
+
+    # 其他内容单独转换，比如全角数字，和 get_digital_dup 一样不能转换的时候返回空字符串
+    invalid = numpy.zeros(len(text), dtype=bool)
+    text_values = text.to_numpy(dtype=object)
+    head_values = head.to_numpy(dtype=object)
+    for i in numpy.flatnonzero(~matched & (text_values != '')):
+        try:
+            keys[i] = str(int(head_values[i]))
+        except ValueError:
+            invalid[i] = True
+
+    return pandas.Series(keys, index=series.index, dtype=object), invalid
+
+
+def digital_invalid_info(name, series, invalid, max_examples=5):
+    """
+    汇总不能转换为数字的内容
+
+    :param name: 列名或者说明
+    :param series: 原始内容
+    :param invalid: 不能转换的行的布尔数组
+    :param max_examples: 最多显示的例子数量
+    :return: 信息字符串，全部可以转换的时候返回 None
+    """
+    invalid_count = int(invalid.sum())
+    if not invalid_count:
+        return None
+    examples = [str(v) for v in series[invalid].iloc[:max_examples]]
+    return f'“{name}” 不能转换为数字: {invalid_count} 行，例如: {examples}'
+
+
 def cleaning_data(df, is_digital=False, dropna_subset=None, exists_subset=None, astype_str_list=None,
-                  multiple_results=False, replace_columns=None):
+                  multiple_results=False, replace_columns=None, key_cache=None, unique_results=False, metrics=None):
     """
     清理检查添加中的空白内容和多余符号
 
     :param df:
-    :param is_digital: 是普通模式还是数字模式，数字模式的时候不转为内容为字符串，不清理无用符号，把内容转换为数字（如果是浮点，去掉小数点，如果不能转换，保留原始内容）
+    :param is_digital: 是普通模式还是数字模式，数字模式的时候不转为内容为字符串，不清理无用符号，把内容转换为数字（如果是浮点，去掉小数点，如果不能转换，内容为空，并在 infos 中汇总不能转换的数量）
     :param dropna_subset: 需要清理的列表
     :param exists_subset: 需要检查重复的条件，也是
     :param astype_str_list: 需要转换为字符串的表格（列）
     :param multiple_results: 填充匹配到的多个结果
     :param replace_columns: 要填充的内容
+    :param key_cache: 检查重复内容的缓存，参考 get_key_cache
+    :param unique_results: 填充多个结果的时候，去掉同一个键中重复的内容
+    :param metrics: MatchMetrics 统计信息，为 None 的时候新建
     :return: 处理过的 df
     """
     infos = []
+    key_cache = get_key_cache(key_cache)
+    if metrics is None:
+        metrics = MatchMetrics()
 
-    # print('cleaning_data', is_digital, dropna_subset, exists_subset, astype_str_list, multiple_results, replace_columns)
+    metrics.count('cleaning_data.rows', len(df))
 
     # 清理需要检查数据中的空白内容
     if dropna_subset is not None:
-        old_count = len(df)
-        df = df.dropna(how='all', subset=dropna_subset)
+        with metrics.stage('cleaning_data.dropna'):
+            old_count = len(df)
+            df = df.dropna(how='all', subset=dropna_subset)
+        metrics.count('cleaning_data.dropna', old_count - len(df))
         info = f'{dropna_subset} 删除空白内容：{old_count - len(df)} 行'
-        print(info)
+        logger.info(info)
         infos.append(info)
 
-    # print('填充数据表中空值')
-    df = df.fillna(value='')
+    # 填充数据表中空值
+    with metrics.stage('cleaning_data.fillna'):
+        df = df.fillna(value='')
 
     if is_digital:
         if exists_subset is not None:
-            df['检查重复'] = df.apply(get_digital_dup, axis=1, args=exists_subset)
-        # raise ValueError('检查重复')
+            with metrics.stage('cleaning_data.key'):
+                df['检查重复'], invalid = get_digital_dup_series(df[exists_subset[0]])
+            metrics.count('cleaning_data.invalid_digital', invalid.sum())
+            info = digital_invalid_info(exists_subset[0], df[exists_subset[0]], invalid)
+            if info:
+                logger.info(info)
+                infos.append(info)
     else:
         # 转换表格内容为字符串
         if isinstance(astype_str_list, list):
             for astype_str in astype_str_list:
-                df[astype_str] = df[astype_str].astype(str)
-                print(f'{"." * 50}')
-                print(f'转换“{astype_str}”列的数据类型为字符串：')
-                print(df[astype_str].astype(str))
-                # print(f'{"." * 50}')
+                with metrics.stage('cleaning_data.astype'):
+                    df[astype_str] = df[astype_str].astype(str)
+                # 整列内容只在调试的时候格式化
+                logger.debug('%s\n转换“%s”列的数据类型为字符串：\n%s', '.' * 50, astype_str, df[astype_str])
         # 处理用来检查重复的字段 清理无用符号
         if exists_subset is not None:
-            df['检查重复'] = df.apply(get_exists_dup, axis=1, args=exists_subset)
+            with metrics.stage('cleaning_data.key'):
+                df['检查重复'] = get_exists_dup_series(df, exists_subset, key_cache=key_cache)
 
-    # print('替换数据')
+    # 合并匹配到的多个结果
     if multiple_results and replace_columns is not None:
-        # 用来保存重复的数据，后面我们合并她
-        replace_dict = {}
-        # 要替换的列
-        check_columns_index = get_columns_index(df, replace_columns)
-        check_index = get_columns_index(df, ['检查重复'])[0]
-        for i, df_line in enumerate(df.values):
-            key = df_line[check_index]
-            if key in replace_dict:
-                df_line_1 = replace_dict[key]
-                # if i < 500:
-                #     print(df_line_1, )
-                for index in check_columns_index:
-                    df_line_1[index] = f"{df_line_1[index]}|{df_line[index]}"
-                # if i < 500:
-                #     print(df_line_1)
-            else:
-                replace_dict[key] = df_line
-
-        # print(df)
-        df = pandas.DataFrame(replace_dict.values(), columns=df.columns)
-        # print(df)
-
-    return {'infos': infos, 'data': df}
-
-
-def df_search(_df, column, keyword, case=True, flags=0, na=None, regex=True):
+        with metrics.stage('cleaning_data.multiple_results'):
+            df = aggregate_multiple_results(df, replace_columns, unique=unique_results)
+
+    return {'infos': infos, 'data': df, 'metrics': metrics}
+
+
+def df_search(_df, column, keyword, case=True, flags=0, na=None, regex=True, index=None):
     """
     在 DataFrame 中搜索
 
     实现依靠 re.search，也可以是用 re.match
+    使用 index（NgramIndex）的时候，不是正则表达式的关键字使用 n-gram 倒排索引搜索，缺失值不匹配
 
     @param _df: 要搜索的 pandas.DataFrame
     @param column: 要搜索的列名
@@ -134,6 +470,7 @@ def df_search(_df, column, keyword, case=True, flags=0, na=None, regex=True):
     @param flags: 默认0（无标志），标志将传递到RE模块，例如 re.IGNORECASE
     @param na: 缺失值的可选填充值
     @param regex: 默认为 True，如果为 True，则使用正则表达式。 如果是 False 则将视为字面字符串
+    @param index: 使用 _df[column] 建立的 NgramIndex，可以保存到文件，参考 ilds.pd.NgramIndex
     @return: 搜索到的 pandas.DataFrame
 
     # 可以看看
@@ -168,168 +505,1137 @@ def df_search(_df, column, keyword, case=True, flags=0, na=None, regex=True):
     # 如果要搜索多个数字，可以使用 isin() 方法。例如，以下代码搜索 age 列中值为 25 或 30 的所有行：
     print(df[df['age'].isin([25, 30])])
     """
+    # 正则表达式中没有特殊字符的时候和字面字符串相同
+    # 空的关键字使用 str.contains，空值的结果由 na 决定
+    if index is not None and keyword != '' and not flags and (not regex or re.escape(keyword) == keyword):
+        if len(index) != len(_df):
+            raise ValueError(f'“{column}”的索引行数 {len(index)} 和数据行数 {len(_df)} 不同')
+        return _df.iloc[index.contains(keyword, case=case)]
     return _df[_df[column].str.contains(keyword, case=case, flags=flags, na=na, regex=regex)]
 
 
-def match_data(df1, df2, check_columns, replace_columns, is_digital):
+def get_trie_regex(words):
+    """
+    把多个字符串转换为一个正则表达式（按字典树合并相同的前缀）
+
+    同一个位置可以匹配多个字符串的时候，匹配最长的字符串
+
+    :param words: 字符串列表，不能包含空字符串
+    :return: 正则表达式字符串
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def to_regex(node):
+        end = '' in node
+        branches = [re.escape(char) + to_regex(child) for char, child in node.items() if char]
+        if not branches:
+            return ''
+        regex = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if end:
+            # 贪婪的可选匹配，先尝试更长的字符串
+            regex = f'(?:{regex})?' if len(branches) == 1 and len(regex) > 1 else regex + '?'
+        return regex
+
+    return to_regex(trie)
+
+
+class SearchIndex:
+    """
+    可以重复使用的搜索索引，一次清理整列内容（转换为小写、清除多余符号），一次扫描搜索多个关键字
+
+    所有关键字合并为一个正则表达式（按字典树合并），用前向断言找到每个位置开始的最长关键字，
+    再加上这个关键字包含的其他关键字，所以重叠的关键字也不会漏掉
+
+    例子：
+    search = SearchIndex(df, '歌曲名称')
+    result = search.search_many(['晴天', '稻香'])  # {'晴天': Index([...]), '稻香': Index([...])}
+    df.loc[result['晴天']]
+    """
+
+    def __init__(self, df, column, clean=True, replace_list=None, key_cache=None):
+        """
+        :param df: 要搜索的 pandas.DataFrame
+        :param column: 要搜索的列名
+        :param clean: 为 True 的时候和“检查重复”一样清理内容，为 False 的时候只转换为小写
+        :param replace_list: 替换指定的字符，参考 cleaning_str
+        :param key_cache: 检查重复内容的缓存，参考 get_key_cache
+        """
+        self.index = df.index
+        self.clean = clean
+        self.replace_list = replace_list
+        # 空值不匹配任何关键字
+        text = str_series(df[column].fillna(''))
+        if clean:
+            text = normalize_series(text, replace_list=replace_list, key_cache=get_key_cache(key_cache))
+        else:
+            text = text.str.lower()
+        self.text = text.to_numpy(dtype=object)
+
+    def normalize(self, keyword):
+        """使用和列内容相同的方法处理关键字"""
+        keyword = str(keyword)
+        if self.clean:
+            return get_str_cleaner(self.replace_list).normalize(keyword)
+        return keyword.lower()
+
+    def search_many(self, keywords):
+        """
+        一次扫描搜索多个关键字
+
+        :param keywords: 关键字列表
+        :return: {关键字: 找到的行的索引（pandas.Index）}，处理以后为空的关键字没有结果
+        """
+        keywords = list(keywords)
+        normalized = {keyword: self.normalize(keyword) for keyword in keywords}
+        words = sorted(set(word for word in normalized.values() if word))
+
+        rows = {word: [] for word in words}
+        if words:
+            # 找到一个关键字的时候，它包含的其他关键字也找到了
+            contained = {word: [other for other in words if other != word and other in word] for word in words}
+            pattern = re.compile(f'(?=({get_trie_regex(words)}))')
+            for i, text in enumerate(self.text):
+                found = pattern.findall(text)
+                if not found:
+                    continue
+                found = set(found)
+                for word in list(found):
+                    found.update(contained[word])
+                for word in found:
+                    rows[word].append(i)
+
+        empty = numpy.array([], dtype=numpy.int64)
+        return {keyword: self.index[numpy.asarray(rows.get(normalized[keyword], empty), dtype=numpy.int64)]
+                for keyword in keywords}
+
+    def search(self, keyword):
+        """
+        搜索一个关键字
+
+        :return: 找到的行的索引（pandas.Index）
+        """
+        return self.search_many([keyword])[keyword]
+
+
+class FuzzyIndex:
+    """
+    模糊匹配用的分块索引，用来找到相似的“检查重复”内容（错别字、表演者顺序不同等）
+
+    相似度是两个内容的字符 n-gram 集合的 Jaccard 相似度
+    使用前缀过滤分块：n-gram 按出现次数从少到多排序，相似度达到 threshold 的两个内容至少有
+    alpha = ceil(threshold * |x|) 个相同的 n-gram，所以前 |x| - alpha + 2 个 n-gram 中至少有两个相同。
+    倒排索引使用前缀中的 n-gram 对，中文常用字的 n-gram 种类有限，单个 n-gram 的倒排列表会随着行数变长，
+    n-gram 对的倒排列表很短，每次匹配的候选数量基本不随行数增加。
+    alpha 为 1 的短内容使用单个 n-gram 的前缀，不会漏掉相似度达到 threshold 的内容
+
+    例子：
+    fuzzy = FuzzyIndex(['周杰伦晴天', '林俊杰江南'], threshold=0.6)
+    fuzzy.match('周杰伦晴天天')
+    """
+
+    def __init__(self, keys, threshold=0.8, n=2):
+        """
+        :param keys: 要匹配的内容列表（不重复）
+        :param threshold: 相似度阈值 0-1
+        :param n: n-gram 的长度
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError(f'相似度阈值需要在 0 到 1 之间: {threshold}')
+        self.keys = list(keys)
+        self.threshold = threshold
+        self.n = n
+
+        self.key_grams = [self.get_grams(key) for key in self.keys]
+        self.sizes = [len(grams) for grams in self.key_grams]
+        self.frequency = {}
+        for grams in self.key_grams:
+            for gram in grams:
+                self.frequency[gram] = self.frequency.get(gram, 0) + 1
+        # n-gram 的全局顺序，用来生成 n-gram 对的编号
+        ordered = sorted(self.frequency, key=lambda gram: (self.frequency[gram], gram))
+        self.rank = {gram: i for i, gram in enumerate(ordered)}
+
+        # alpha 为 1 的查询只能匹配到 |y| <= 1 / threshold^2 的内容，这些内容使用单个 n-gram 的前缀
+        small_size = 1 / threshold ** 2 + 1e-9
+        self.postings = {}
+        pair_codes, pair_ids = [], []
+        for i, grams in enumerate(self.key_grams):
+            size = len(grams)
+            if not size:
+                continue
+            ordered = self._ordered(grams)
+            alpha = self._alpha(size)
+            if size <= small_size:
+                for gram in ordered[:size - alpha + 1]:
+                    self.postings.setdefault(gram, []).append(i)
+            if size >= 2:
+                codes = self._pair_codes(ordered[:size - max(alpha, 2) + 2])
+                pair_codes.extend(codes)
+                pair_ids.extend([i] * len(codes))
+
+        # n-gram 对的倒排索引（CSR）：pair_codes 排序去重，pair_ids[pair_offsets[j]:pair_offsets[j + 1]] 是第 j 个对的内容
+        pair_codes = numpy.asarray(pair_codes, dtype=numpy.int64)
+        order = numpy.argsort(pair_codes, kind='stable')
+        pair_codes = pair_codes[order]
+        starts = numpy.flatnonzero(numpy.r_[True, pair_codes[1:] != pair_codes[:-1]]) if len(pair_codes) else \
+            numpy.array([], dtype=numpy.int64)
+        self.pair_codes = pair_codes[starts]
+        self.pair_offsets = numpy.append(starts, len(pair_codes))
+        self.pair_ids = numpy.asarray(pair_ids, dtype=numpy.int64)[order]
+
+    def get_grams(self, text):
+        """获取内容的 n-gram 集合"""
+        n = self.n
+        if len(text) <= n:
+            return frozenset([text]) if text else frozenset()
+        return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+    def _alpha(self, size):
+        """相似度达到阈值的时候最少的相同 n-gram 数量"""
+        return max(math.ceil(self.threshold * size - 1e-9), 1)
+
+    def _ordered(self, grams):
+        """按出现次数从少到多排序，没有出现过的 n-gram 排在最前面"""
+        return sorted(grams, key=lambda gram: (self.frequency.get(gram, 0), gram))
+
+    def _pair_codes(self, prefix):
+        """前缀中 n-gram 对的编号，没有出现过的 n-gram 不会相同，不需要编号"""
+        ranks = [self.rank[gram] for gram in prefix if gram in self.rank]
+        count = len(self.rank)
+        return [a * count + b for j, a in enumerate(ranks) for b in ranks[j + 1:]]
+
+    def _candidates(self, grams):
+        """查找可能达到阈值的内容"""
+        size = len(grams)
+        ordered = self._ordered(grams)
+        alpha = self._alpha(size)
+        if alpha == 1:
+            candidates = set()
+            for gram in ordered[:size]:
+                candidates.update(self.postings.get(gram, ()))
+            return candidates
+
+        codes = numpy.asarray(self._pair_codes(ordered[:size - alpha + 2]), dtype=numpy.int64)
+        positions = numpy.searchsorted(self.pair_codes, codes)
+        found = positions < len(self.pair_codes)
+        found[found] = self.pair_codes[positions[found]] == codes[found]
+        positions = positions[found]
+        return set(numpy.concatenate([self.pair_ids[self.pair_offsets[j]:self.pair_offsets[j + 1]]
+                                      for j in positions]).tolist()) if len(positions) else set()
+
+    def match(self, text):
+        """
+        查找最相似的内容
+
+        :param text: 要匹配的内容
+        :return: (内容, 相似度)，没有找到的时候返回 (None, 0.0)
+        """
+        grams = self.get_grams(text)
+        size = len(grams)
+        if not size:
+            return None, 0.0
+
+        threshold = self.threshold
+        best, best_score = None, 0.0
+        for i in sorted(self._candidates(grams)):
+            # 长度过滤：集合大小相差太多的时候不可能达到阈值
+            other_size = self.sizes[i]
+            if other_size < threshold * size or size < threshold * other_size:
+                continue
+            common = len(grams & self.key_grams[i])
+            score = common / (size + other_size - common)
+            if score >= threshold and score > best_score:
+                best, best_score = i, score
+        if best is None:
+            return None, 0.0
+        return self.keys[best], best_score
+
+    def match_many(self, texts):
+        """
+        批量查找最相似的内容，相同的内容只计算一次
+
+        :return: (内容数组, 相似度数组)，没有找到的内容为 None，相似度为 0
+        """
+        results = {}
+        keys = numpy.empty(len(texts), dtype=object)
+        scores = numpy.zeros(len(texts), dtype=float)
+        for i, text in enumerate(texts):
+            if text not in results:
+                results[text] = self.match(text)
+            keys[i], scores[i] = results[text]
+        return keys, scores
+
+
+class MatchIndex:
+    """
+    匹配用的索引，用 df1 的“检查重复”列建立 键 -> 填充内容 的哈希索引
+
+    同一个键有多行数据的时候，使用第一次出现的内容填充，其他不同的内容记录为冲突
+
+    例子：
+    index = MatchIndex.from_df(df1, ['歌曲ID', '专辑名称'])
+    found, values = index.lookup(df2['检查重复'])
+    """
+
+    def __init__(self, table, replace_columns, conflicts=None, source_count=None):
+        """
+        :param table: 以键为索引（唯一），以 replace_columns 为列的 DataFrame
+        :param replace_columns: 要填充的列
+        :param conflicts: {键: [(列名, 内容), ...]} 重复的键中和第一次出现的内容不同的值
+        :param source_count: 数据源的行数
+        """
+        self.table = table
+        self.replace_columns = list(replace_columns)
+        self.conflicts = conflicts or {}
+        self.source_count = len(table) if source_count is None else source_count
+
+    @classmethod
+    def from_df(cls, df, replace_columns, key_column='检查重复'):
+        """
+        从 DataFrame 建立索引
+
+        :param df: 数据源，需要包含 key_column 列
+        :param replace_columns: 要填充的列
+        :param key_column: 用来匹配的列
+        :return: MatchIndex
+        """
+        replace_columns = list(replace_columns)
+        keys = df[key_column]
+        first = ~keys.duplicated(keep='first').to_numpy()
+        table = pandas.DataFrame({col: df[col].to_numpy()[first] for col in replace_columns},
+                                 index=pandas.Index(keys.to_numpy()[first], name=key_column))
+
+        # 只在有重复键的时候检查冲突，和第一次出现的内容比较
+        conflicts = {}
+        if not first.all() and replace_columns:
+            positions = table.index.get_indexer(keys)
+            differ = numpy.zeros(len(df), dtype=bool)
+            columns_values = []
+            for col in replace_columns:
+                values = df[col].to_numpy(dtype=object)
+                first_values = table[col].to_numpy(dtype=object)[positions]
+                differ |= values != first_values
+                columns_values.append((col, values, first_values))
+            key_values = keys.to_numpy()
+            for i in numpy.flatnonzero(differ):
+                key_conflicts = conflicts.setdefault(key_values[i], [])
+                for col, values, first_values in columns_values:
+                    if values[i] != first_values[i]:
+                        key_conflicts.append((col, values[i]))
+
+        return cls(table, replace_columns, conflicts, source_count=len(df))
+
+    def save(self, file_path):
+        """保存索引到文件"""
+        save_pickle({'version': MATCH_INDEX_VERSION, 'table': self.table, 'replace_columns': self.replace_columns,
+                     'conflicts': self.conflicts, 'source_count': self.source_count}, file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        从文件读取索引
+
+        :return: MatchIndex，版本不同的时候返回 None
+        """
+        data = load_pickle(file_path)
+        if data.get('version') != MATCH_INDEX_VERSION:
+            return None
+        return cls(data['table'], data['replace_columns'], data['conflicts'], source_count=data['source_count'])
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, key):
+        return key in self.table.index
+
+    def contains(self, keys):
+        """
+        检查多个键是否存在
+
+        :param keys: 键的列表或 Series
+        :return: numpy 布尔数组
+        """
+        return self.table.index.get_indexer(keys) >= 0
+
+    def lookup(self, keys):
+        """
+        一次查找多个键
+
+        :param keys: 键的列表或 Series
+        :return: (found, values) found 是 numpy 布尔数组，values 是找到的键对应的内容（按 keys 的顺序，只包含找到的行）
+        """
+        positions = self.table.index.get_indexer(keys)
+        found = positions >= 0
+        values = self.table.iloc[positions[found]].reset_index(drop=True)
+        return found, values
+
+    def get_conflicts(self, key):
+        """获取键的冲突内容 [(列名, 内容), ...]"""
+        return self.conflicts.get(key, [])
+
+    def fuzzy_index(self, threshold=0.8):
+        """获取模糊匹配用的 FuzzyIndex，相同的阈值只建立一次"""
+        fuzzy_indexes = self.__dict__.setdefault('_fuzzy_indexes', {})
+        if threshold not in fuzzy_indexes:
+            fuzzy_indexes[threshold] = FuzzyIndex(self.table.index, threshold=threshold)
+        return fuzzy_indexes[threshold]
+
+    def fingerprint(self):
+        """索引内容的指纹，用来判断以前的匹配结果是否可以使用"""
+        hash_obj = hashlib.md5()
+        hash_obj.update(str({'replace_columns': self.replace_columns, 'source_count': self.source_count}).encode('utf-8'))
+        hash_obj.update(pandas.util.hash_pandas_object(self.table.reset_index(), index=False).to_numpy().tobytes())
+        return hash_obj.hexdigest()
+
+
+def _sqlite_value(value):
+    """转换为 sqlite3 支持的类型"""
+    if value is None or isinstance(value, (str, int, float, bytes)):
+        return value
+    if isinstance(value, numpy.generic):
+        return value.item()
+    if pandas.isna(value):
+        return None
+    return str(value)
+
+
+def _sqlite_values(values):
+    """转换一列内容为 sqlite3 支持的类型"""
+    return [_sqlite_value(value) for value in numpy.asarray(values, dtype=object).tolist()]
+
+
+class SqliteMatchIndex:
+    """
+    保存在 SQLite 文件中的匹配索引，和 MatchIndex 的用法相同，数据源不需要全部读取到内存中
+
+    键保存在 WITHOUT ROWID 表的主键中，填充内容和键在同一个 B 树中，查找的时候不需要回表。
+    同一个键有多行数据的时候，使用第一次写入的内容填充，其他不同的内容记录为冲突（相同的冲突内容只记录一次）。
+    可以多次调用 append 添加新的数据（比如每个月新的歌曲目录）
+
+    例子：
+    index = SqliteMatchIndex('歌曲目录.db', ['歌曲ID', '专辑名称'])
+    index.append(cleaning_data(df1, ...)['data'])
+    r = match_data(None, df2, check_columns, ['歌曲ID', '专辑名称'], is_digital=False, index=index)
+
+    # 以后直接打开已经存在的文件
+    index = SqliteMatchIndex('歌曲目录.db')
+    """
+
+    def __init__(self, file_path, replace_columns=None):
+        """
+        :param file_path: SQLite 文件
+        :param replace_columns: 要填充的列，打开已经存在的文件的时候可以为 None，不为 None 的时候需要和文件中的相同
+        """
+        self.file_path = file_path
+        self.connection = sqlite3.connect(file_path)
+        self._create_tables(replace_columns)
+
+    def _create_tables(self, replace_columns):
+        con = self.connection
+        con.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+        meta = dict(con.execute('SELECT name, value FROM meta'))
+
+        if meta:
+            if int(meta['version']) != MATCH_INDEX_VERSION:
+                raise ValueError(f'索引文件的版本不同: {self.file_path}')
+            self.replace_columns = json.loads(meta['replace_columns'])
+            if replace_columns is not None and list(replace_columns) != self.replace_columns:
+                raise ValueError(f'要填充的列和索引文件中的不同: {list(replace_columns)} != {self.replace_columns}')
+            return
+
+        if replace_columns is None:
+            raise ValueError(f'新建索引文件需要 replace_columns: {self.file_path}')
+        self.replace_columns = list(replace_columns)
+
+        # 列名可能包含任何字符，表中使用 c0、c1 ... 保存
+        columns = ''.join(f', c{i}' for i in range(len(self.replace_columns)))
+        with con:
+            con.execute(f'CREATE TABLE keys (key PRIMARY KEY{columns}) WITHOUT ROWID')
+            con.execute('CREATE TABLE conflicts (key, column TEXT, value)')
+            con.execute('CREATE INDEX conflicts_key ON conflicts (key)')
+            con.executemany('INSERT INTO meta VALUES (?, ?)', [
+                ('version', str(MATCH_INDEX_VERSION)),
+                ('replace_columns', json.dumps(self.replace_columns, ensure_ascii=False)),
+                ('source_count', '0'),
+            ])
+
+    @classmethod
+    def from_df(cls, df, replace_columns, file_path, key_column='检查重复'):
+        """
+        从 DataFrame 建立索引文件，文件已经存在的时候添加到文件中
+
+        :param df: 数据源，需要包含 key_column 列
+        :param replace_columns: 要填充的列
+        :param file_path: SQLite 文件
+        :param key_column: 用来匹配的列
+        :return: SqliteMatchIndex
+        """
+        index = cls(file_path, replace_columns)
+        index.append(df, key_column=key_column)
+        return index
+
+    def __getstate__(self):
+        # sqlite3 的连接不能传给其他进程，只传文件路径
+        return {'file_path': self.file_path}
+
+    def __setstate__(self, state):
+        self.__init__(state['file_path'])
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def source_count(self):
+        """添加过的数据源行数"""
+        return int(self.connection.execute("SELECT value FROM meta WHERE name = 'source_count'").fetchone()[0])
+
+    @property
+    def conflicts(self):
+        """冲突内容的数量"""
+        return self.connection.execute('SELECT COUNT(*) FROM conflicts').fetchone()[0]
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM keys').fetchone()[0]
+
+    def __contains__(self, key):
+        return self.connection.execute('SELECT 1 FROM keys WHERE key = ?', (_sqlite_value(key),)).fetchone() is not None
+
+    def _probe(self, keys):
+        """
+        查找多个键，不重复的键写入临时表，和 keys 表连接一次查询
+
+        :return: (positions, table) positions 是每个键在 table 中的位置（没有找到为 -1），table 以键为索引
+        """
+        codes, uniques = pandas.factorize(pandas.Series(keys, dtype=object))
+        con = self.connection
+        con.execute('CREATE TEMP TABLE IF NOT EXISTS probe (key PRIMARY KEY) WITHOUT ROWID')
+        con.execute('DELETE FROM temp.probe')
+        con.executemany('INSERT OR IGNORE INTO temp.probe VALUES (?)', ((key,) for key in _sqlite_values(uniques)))
+        rows = con.execute('SELECT k.* FROM temp.probe p JOIN keys k ON k.key = p.key').fetchall()
+        con.execute('DELETE FROM temp.probe')
+
+        table = pandas.DataFrame.from_records(rows, columns=['key'] + self.replace_columns).set_index('key')
+        unique_positions = table.index.get_indexer(uniques) if len(table) else numpy.full(len(uniques), -1)
+        positions = numpy.where(codes >= 0, unique_positions[codes], -1)
+        return positions, table
+
+    def contains(self, keys):
+        """
+        检查多个键是否存在
+
+        :param keys: 键的列表或 Series
+        :return: numpy 布尔数组
+        """
+        positions, _ = self._probe(keys)
+        return positions >= 0
+
+    def lookup(self, keys):
+        """
+        一次查找多个键，参考 MatchIndex.lookup
+
+        :param keys: 键的列表或 Series
+        :return: (found, values)
+        """
+        positions, table = self._probe(keys)
+        found = positions >= 0
+        values = table.iloc[positions[found]].reset_index(drop=True)
+        return found, values
+
+    def get_conflicts(self, key):
+        """获取键的冲突内容 [(列名, 内容), ...]"""
+        return self.connection.execute('SELECT column, value FROM conflicts WHERE key = ? ORDER BY rowid',
+                                       (_sqlite_value(key),)).fetchall()
+
+    def append(self, df, key_column='检查重复'):
+        """
+        添加数据源，已经存在的键不修改，内容不同的时候记录为冲突，已经记录的冲突内容不重复记录
+
+        :param df: 数据源，需要包含 key_column 列和 replace_columns
+        :param key_column: 用来匹配的列
+        :return: 新添加的键的数量
+        """
+        batch = MatchIndex.from_df(df, self.replace_columns, key_column=key_column)
+        exists_positions, exists_table = self._probe(batch.table.index)
+        exists = exists_positions >= 0
+
+        # 新的键：写入第一次出现的内容，本次数据中的冲突直接保存
+        new_table = batch.table[~exists]
+        new_keys = set(new_table.index)
+        conflicts = [(key, col, value) for key, key_conflicts in batch.conflicts.items() if key in new_keys
+                     for col, value in key_conflicts]
+
+        # 已经存在的键：每一行都和文件中的内容比较
+        if exists.any():
+            keys = df[key_column]
+            positions = pandas.Index(batch.table.index[exists]).get_indexer(keys)
+            rows = numpy.flatnonzero(positions >= 0)
+            stored = exists_table.iloc[exists_positions[exists][positions[rows]]]
+            key_values = keys.to_numpy(dtype=object)[rows]
+            for col in self.replace_columns:
+                values = df[col].to_numpy(dtype=object)[rows]
+                differ = values != stored[col].to_numpy(dtype=object)
+                conflicts.extend((key, col, value) for key, value in zip(key_values[differ], values[differ]))
+
+        columns = [new_table.index] + [new_table[col] for col in self.replace_columns]
+        placeholders = ', '.join('?' * len(columns))
+        with self.connection as con:
+            con.executemany(f'INSERT INTO keys VALUES ({placeholders})', zip(*[_sqlite_values(c) for c in columns]))
+            # 已经保存的冲突内容不重复保存（IS 比较的时候 NULL 也相同），重复添加同一个数据源的时候冲突数量不变
+            con.executemany('INSERT INTO conflicts SELECT ?1, ?2, ?3 WHERE NOT EXISTS '
+                            '(SELECT 1 FROM conflicts WHERE key IS ?1 AND column = ?2 AND value IS ?3)',
+                            ((_sqlite_value(key), col, _sqlite_value(value)) for key, col, value in conflicts))
+            con.execute("UPDATE meta SET value = CAST(value AS INTEGER) + ? WHERE name = 'source_count'", (len(df),))
+        self.__dict__.pop('_fuzzy_indexes', None)
+        return len(new_table)
+
+    def fuzzy_index(self, threshold=0.8):
+        """获取模糊匹配用的 FuzzyIndex，需要把全部的键读取到内存中"""
+        fuzzy_indexes = self.__dict__.setdefault('_fuzzy_indexes', {})
+        if threshold not in fuzzy_indexes:
+            keys = [row[0] for row in self.connection.execute('SELECT key FROM keys')]
+            fuzzy_indexes[threshold] = FuzzyIndex(keys, threshold=threshold)
+        return fuzzy_indexes[threshold]
+
+    def fingerprint(self):
+        """索引内容的指纹，文件只能添加数据，所以使用文件路径和数量"""
+        return str({'file_path': os.path.abspath(self.file_path), 'source_count': self.source_count, 'count': len(self),
+                    'conflicts': self.conflicts})
+
+
+def match_data(df1, df2, check_columns, replace_columns, is_digital, index=None, key_cache=None, fuzzy_threshold=None,
+               score_column='匹配相似度', metrics=None, max_conflict_examples=20, conflict_export=False):
     """
     匹配数据并填充匹配到的数据
+
+    :param df1: 数据源，需要包含“检查重复”列
+    :param df2: 要填充的数据
+    :param check_columns: 检查条件
+    :param replace_columns: 要填充的内容
+    :param is_digital: 数字版
+    :param index: 已经建立好的 MatchIndex，为 None 的时候使用 df1 建立
+    :param key_cache: 检查重复内容的缓存，参考 get_key_cache
+    :param fuzzy_threshold: 模糊匹配的相似度阈值（0-1），没有完全相同的内容的时候匹配最相似的内容，参考 FuzzyIndex
+    :param score_column: 模糊匹配的时候保存相似度的列，完全相同的内容为 1
+    :param metrics: MatchMetrics 统计信息，为 None 的时候新建
+    :param max_conflict_examples: 冲突内容在 infos 中最多显示的数量，参考 ConflictReport
+    :param conflict_export: 保存全部的冲突内容，可以用 r['conflicts'].to_dataframe() 导出
+    :return: {'infos': infos, 'data': df2, 'metrics': metrics, 'matched': 匹配到的行的位置（包括模糊匹配），
+              'conflicts': ConflictReport}
     """
 
     infos = []
+    key_cache = get_key_cache(key_cache)
+    if metrics is None:
+        metrics = MatchMetrics()
 
     # 填充数据表中空值
-    df2 = df2.fillna(value='')
-
-    # 要检查的列
-    check_columns_index = get_columns_index(df2, check_columns)
-
-    replace_count = 0
-    ignore_whitespace_count = 0
+    with metrics.stage('match_data.fillna'):
+        df2 = df2.fillna(value='')
 
     # 设置要填充的列的值
     for replace_column in replace_columns:
         if replace_column not in df2.columns:
             df2[replace_column] = ''
 
-    # 要填充的数据
-    replace_columns_index = get_columns_index(df1, replace_columns)
-    info = f"填充的数据:{replace_columns}，填充的数据索引:{replace_columns_index}"
-    print(info)
+    if index is None:
+        with metrics.stage('match_data.index'):
+            index = MatchIndex.from_df(df1, replace_columns)
+
+    info = f"填充的数据:{replace_columns}"
+    logger.info(info)
     infos.append(info)
 
-    for i, df_line in enumerate(df2.values):
-        # print(df_line)
-        # print(''.join([df_line[k] for k in check_columns_index]))
-        # 获取需要检查的内容
-        try:
-            if is_digital:
-                ch = get_digital_dup(df_line, *check_columns_index)
-            else:
-                ch = get_exists_dup(df_line, *check_columns_index)
-        except Exception as e:
-            # print([df_line[k] for k in check_columns_index])
-            raise ValueError('%s %s' % ([str(df_line[k]) for k in check_columns_index], e))
-
-        # 忽略空白内容的匹配
-        if not ch:
-            ignore_whitespace_count += 1
-            continue
-
-        # if len(df1[df1['检查重复'].isin([ch])]) > 1:
-        #     print(df1[df1['检查重复'].isin([ch])])
-        #     # print(get_exists_dup(df_line))
-
-        # if i < 200000000:
-        replace_dict = {}
-        # if len(df1[df1['检查重复'].isin([ch])]):
-        # 找到重复内容
-        for df_neirong in df1[df1['检查重复'].isin([ch])].values:
-            # print(df_neirong)
-            # 填充重复内容
-            for columns_i in range(len(replace_columns)):
-                # print(df_neirong[replace_columns_index[columns_i]])
-                # 把找到的歌曲放在字典里面
-                neirong = df_neirong[replace_columns_index[columns_i]]
-                replace_column = replace_columns[columns_i]
-                # if neirong:
-                if replace_column in replace_dict and neirong != replace_dict[replace_column]:
-                    info = f'重复（{replace_column}）: {neirong}'
-                    # print(info)
-                    infos.append(info)
-                else:
-                    replace_dict[replace_column] = neirong
-                    # print(f'匹配：{ch} ------------- 找到 {replace_column}: {neirong}')
-        # 处理找到的结果
-        # print(df_line)
-        # if replace_dict:
-        #     print('找到内容',df_line)
-        # 替换找到的内容到表格
-        for k, v in replace_dict.items():
-            df2.iloc[i, df2.columns.get_loc(k)] = v
-            replace_count += 1
-
-    # print(str(df2.values[0][0]))
-    # print(''.join([df2.values[0][k] for k in check_columns_index]))
-    # print(df1[df1['检查重复'].isin([get_exists_dup(df2.values[0])])])
-    # df1.iloc[0, df.columns.get_loc('表演者2')] = 5
-
-    # print(strstrip(''.join([df2.values[0][k] for k in check_columns_index])))
-    # print(df2.values[0])
+    # 获取需要检查的内容
+    if is_digital:
+        with metrics.stage('match_data.key'):
+            keys, invalid = get_digital_dup_series(df2[check_columns[0]])
+        metrics.count('match_data.invalid_digital', invalid.sum())
+        info = digital_invalid_info(check_columns[0], df2[check_columns[0]], invalid)
+        if info:
+            logger.info(info)
+            infos.append(info)
+    else:
+        with metrics.stage('match_data.key'):
+            keys = get_exists_dup_series(df2, check_columns, key_cache=key_cache)
+
+    # 忽略空白内容的匹配
+    not_empty = (keys != '').to_numpy()
+    ignore_whitespace_count = int((~not_empty).sum())
+
+    with metrics.stage('match_data.lookup'):
+        lookup_keys = keys[not_empty]
+        found, values = index.lookup(lookup_keys)
+        matched = numpy.flatnonzero(not_empty)[found]
+        matched_keys = lookup_keys.to_numpy(dtype=object)[found]
+    metrics.count('match_data.rows', len(df2))
+    metrics.count('match_data.hit', len(matched))
+    metrics.count('match_data.miss', int(not_empty.sum()) - len(matched))
+    metrics.count('match_data.empty', ignore_whitespace_count)
+
+    # 模糊匹配没有找到的内容
+    if fuzzy_threshold:
+        with metrics.stage('match_data.fuzzy'):
+            scores = numpy.full(len(df2), '', dtype=object)
+            scores[matched] = 1.0
+            not_found = numpy.flatnonzero(not_empty)[~found]
+            fuzzy_keys, fuzzy_scores = index.fuzzy_index(fuzzy_threshold).match_many(keys.iloc[not_found].tolist())
+            fuzzy_found = pandas.notna(fuzzy_keys)
+            _, fuzzy_values = index.lookup(fuzzy_keys[fuzzy_found])
+            scores[not_found[fuzzy_found]] = numpy.round(fuzzy_scores[fuzzy_found], 4)
+            df2[score_column] = scores
+
+            metrics.count('match_data.fuzzy_hit', fuzzy_found.sum())
+            info = f'模糊匹配（相似度 >= {fuzzy_threshold}）: {int(fuzzy_found.sum())} / {len(not_found)}'
+            logger.info(info)
+            infos.append(info)
+
+            # 按行的顺序合并完全匹配和模糊匹配的结果
+            matched = numpy.concatenate([matched, not_found[fuzzy_found]])
+            matched_keys = numpy.concatenate([matched_keys, fuzzy_keys[fuzzy_found]])
+            values = pandas.concat([values, fuzzy_values], ignore_index=True)
+            order = numpy.argsort(matched, kind='stable')
+            matched, matched_keys = matched[order], matched_keys[order]
+            values = values.iloc[order].reset_index(drop=True)
+
+    # 一个键对应多个不同内容的时候，汇总冲突内容，只显示一部分例子
+    conflicts = ConflictReport(max_examples=max_conflict_examples, keep_all=conflict_export)
+    if index.conflicts and len(matched_keys):
+        with metrics.stage('match_data.conflicts'):
+            key_counts = pandas.Series(matched_keys, dtype=object).value_counts(sort=False)
+            for key, count in key_counts.items():
+                conflicts.add(key, index.get_conflicts(key), count)
+    if conflicts.total:
+        metrics.count('match_data.conflicts', conflicts.total)
+        info = str(conflicts)
+        logger.info(info)
+        infos.append(info)
+        infos.extend(conflicts.examples)
+
+    # 替换找到的内容到表格
+    if len(matched):
+        with metrics.stage('match_data.write'):
+            for replace_column in replace_columns:
+                column_values = df2[replace_column].to_numpy(dtype=object, copy=True)
+                column_values[matched] = values[replace_column].to_numpy(dtype=object)
+                df2[replace_column] = column_values
+    replace_count = len(matched) * len(replace_columns)
 
     count = len(df2.values)
     info = f'{"*" * 70}\n匹配总数: {count}，填充数据: {replace_count}，未找到: {count - replace_count - ignore_whitespace_count}，忽略空白: {ignore_whitespace_count}\n{"*" * 70}'
-    print(info)
+    logger.info(info)
     infos.append(info)
 
-    return {'infos': infos, 'data': df2}
+    return {'infos': infos, 'data': df2, 'metrics': metrics, 'matched': matched, 'conflicts': conflicts}
 
 
-def add_duplicate_tags(df1, df2, check_columns, tags_title="重复", tags_list=None, is_digital=False):
+def add_duplicate_tags(df1, df2, check_columns, tags_title="重复", tags_list=None, is_digital=False, key_cache=None, index=None,
+                       metrics=None):
     """
     匹配数据并添加重复标记
+
+    :param df1: 数据源，需要包含“检查重复”列
+    :param df2: 要标记的数据
+    :param check_columns: 检查条件
+    :param tags_title: 标记的列名
+    :param tags_list: 标记的内容 [重复, 不重复]
+    :param is_digital: 数字版
+    :param key_cache: 检查重复内容的缓存，参考 get_key_cache
+    :param index: 已经建立好的 MatchIndex，为 None 的时候使用 df1 建立
+    :param metrics: MatchMetrics 统计信息，为 None 的时候新建
+    :return: {'infos': infos, 'data': df2, 'metrics': metrics}
     """
 
     infos = []
+    key_cache = get_key_cache(key_cache)
+    if metrics is None:
+        metrics = MatchMetrics()
 
     if tags_list is None:
         tags_list = ['是', '否']  # True, False
 
-    # 要检查的列
-    check_columns_index = get_columns_index(df2, check_columns)
-
-    chongfu_count = 0
-    ignore_whitespace_count = 0
+    if index is None:
+        with metrics.stage('add_duplicate_tags.index'):
+            index = MatchIndex.from_df(df1, [])
 
     df2[tags_title] = tags_list[1]
-    chongfu_col = df2.columns.get_loc(tags_title)
-    # print(len(df2.columns))
-
-    for i, df_line in enumerate(df2.values):
-        # print(df_line)
-        # print(''.join([df_line[k] for k in check_columns_index]))
-        check_str = ''.join([str(df_line[k]) for k in check_columns_index])
-        if not check_str:
-            ignore_whitespace_count += 1
-            continue
+
+    # 获取需要检查的内容
+    with metrics.stage('add_duplicate_tags.key'):
+        parts = [str_series(df2[col]) for col in check_columns]
+        check_str = parts[0].str.cat(parts[1:]) if len(parts) > 1 else parts[0]
+        not_empty = (check_str != '').to_numpy()
+        ignore_whitespace_count = int((~not_empty).sum())
+
+        check_str = check_str[not_empty]
+        if is_digital:
+            keys, invalid = get_digital_dup_series(check_str)
+        else:
+            keys = normalize_series(check_str, key_cache=key_cache)
+            invalid = numpy.zeros(len(keys), dtype=bool)
+
+    if is_digital:
+        metrics.count('add_duplicate_tags.invalid_digital', invalid.sum())
+        info = digital_invalid_info('、'.join(check_columns), check_str, invalid)
+        if info:
+            logger.info(info)
+            infos.append(info)
+
+    # 标记重复内容，不能转换为数字的内容不标记
+    with metrics.stage('add_duplicate_tags.lookup'):
+        duplicate = numpy.zeros(len(df2), dtype=bool)
+        duplicate[not_empty] = index.contains(keys) & ~invalid
+    with metrics.stage('add_duplicate_tags.write'):
+        df2[tags_title] = numpy.where(duplicate, tags_list[0], tags_list[1])
+    chongfu_count = int(duplicate.sum())
+    metrics.count('add_duplicate_tags.rows', len(df2))
+    metrics.count('add_duplicate_tags.hit', chongfu_count)
+    metrics.count('add_duplicate_tags.miss', len(df2) - chongfu_count - ignore_whitespace_count)
+    metrics.count('add_duplicate_tags.empty', ignore_whitespace_count)
+
+    count = len(df2.values)
+    info = f'{"*" * 70}\n匹配总数: {count}，重复: {chongfu_count}，未找到: {count - chongfu_count - ignore_whitespace_count}，忽略空白: {ignore_whitespace_count}\n{"*" * 70}'
+    logger.info(info)
+    infos.append(info)
+
+    return {'infos': infos, 'data': df2, 'metrics': metrics}
+
+
+def get_match_index_fingerprint(df, check_columns, replace_columns, **params):
+    """
+    根据数据源内容和清理参数生成索引的指纹，用来判断保存的索引是否可以使用
+
+    只计算 check_columns 和 replace_columns 的内容，其他列的修改不影响索引
+
+    :param df: 没有清理的数据源
+    :param check_columns: 检查条件
+    :param replace_columns: 要填充的内容
+    :param params: 其他清理参数，比如 is_digital、multiple_results
+    :return: 指纹字符串
+    """
+    # check_columns 和 replace_columns 分开计算，同样的列分成不同的检查条件和填充内容的时候索引不同
+    columns = list(dict.fromkeys(list(check_columns) + list(replace_columns)))
+    hash_obj = hashlib.md5()
+    hash_obj.update(str({'version': MATCH_INDEX_VERSION, 'check_columns': list(check_columns),
+                         'replace_columns': list(replace_columns), 'dtypes': [str(df[col].dtype) for col in columns],
+                         'replace_list': REPLACE_LIST, 'clean_str': CLEAN_STR, **params}).encode('utf-8'))
+    hash_obj.update(pandas.util.hash_pandas_object(df[columns], index=False).to_numpy().tobytes())
+    return hash_obj.hexdigest()
+
+
+def build_match_index(df, check_columns, replace_columns, is_digital=False, multiple_results=False, unique_results=False,
+                      key_cache=None, index_cache_dir=None, metrics=None):
+    """
+    清理数据源并建立 MatchIndex
+
+    设置 index_cache_dir 的时候，索引保存在缓存中（参考 ilds.cache，限制总大小），数据源和参数没有变化的时候直接读取保存的索引
+
+    :param df: 数据源
+    :param check_columns: 检查条件
+    :param replace_columns: 要填充的内容，标记重复的时候为 []
+    :param is_digital: 数字版
+    :param multiple_results: 填充匹配到的多个结果
+    :param unique_results: 填充多个结果的时候，去掉同一个键中重复的内容
+    :param key_cache: 检查重复内容的缓存，参考 get_key_cache
+    :param index_cache_dir: 保存索引的缓存，True 使用 get_cache_manager()，也可以是 CacheManager，
+                            或者文件夹（使用这个文件夹的 CacheManager）
+    :param metrics: MatchMetrics 统计信息，为 None 的时候新建
+    :return: {'infos': infos, 'data': index, 'metrics': metrics}
+    """
+    infos = []
+    if metrics is None:
+        metrics = MatchMetrics()
+
+    cache = None
+    if index_cache_dir is not None and index_cache_dir is not False:
+        if isinstance(index_cache_dir, CacheManager):
+            cache = index_cache_dir
+        else:
+            cache = get_cache_manager() if index_cache_dir is True else CacheManager(index_cache_dir)
         try:
-            if is_digital:
-                ch = cleaning_digital(check_str)
-            else:
-                ch = cleaning_str(check_str)
+            fingerprint = get_match_index_fingerprint(df, check_columns, replace_columns, is_digital=is_digital,
+                                                      multiple_results=multiple_results, unique_results=unique_results)
         except Exception as e:
-            # print([df_line[k] for k in check_columns_index])
-            raise ValueError('%s %s' % ([df_line[k] for k in check_columns_index], e))
+            logger.warning('生成数据源索引指纹失败，不使用缓存 %s', e)
+            cache = None
+
+    cache_file = cache.get('match_index', fingerprint, '.pkl') if cache is not None else None
+    if cache_file is not None:
+        with metrics.stage('build_match_index.load'):
+            index = MatchIndex.load(cache_file)
+        if index is not None and index.replace_columns != list(replace_columns):
+            logger.warning('缓存的数据源索引要填充的列不同，重新建立索引: %s != %s', index.replace_columns, list(replace_columns))
+            index = None
+        if index is not None:
+            metrics.count('build_match_index.cache_hit')
+            info = f'从缓存载入数据源索引: {cache_file}'
+            logger.info(info)
+            infos.append(info)
+            return {'infos': infos, 'data': index, 'metrics': metrics}
 
-        # if len(df1[df1['检查重复'].isin([ch])]) > 1:
-        #     print(df1[df1['检查重复'].isin([ch])])
-        #     # print(get_exists_dup(df_line))
+    r = cleaning_data(df, is_digital=is_digital, dropna_subset=check_columns, exists_subset=check_columns,
+                      astype_str_list=check_columns, multiple_results=multiple_results,
+                      replace_columns=replace_columns or None, key_cache=key_cache, unique_results=unique_results,
+                      metrics=metrics)
+    infos.extend(r['infos'])
+    with metrics.stage('build_match_index.index'):
+        index = MatchIndex.from_df(r['data'], replace_columns)
+    metrics.count('build_match_index.keys', len(index))
+
+    if cache is not None:
+        with metrics.stage('build_match_index.save'):
+            cache_file = cache.path('match_index', fingerprint, '.pkl')
+            index.save(cache_file)
+            cache.put('match_index', fingerprint, '.pkl')
+        info = f'保存数据源索引: {cache_file}'
+        logger.info(info)
+        infos.append(info)
 
-        # if i < 200000000:
-        replace_dict = {}
-        if len(df1[df1['检查重复'].isin([ch])]):
-            # 标记重复内容
-            # print(len(df2.columns))
-            df2.iloc[i, chongfu_col] = tags_list[0]
-            chongfu_count += 1
+    return {'infos': infos, 'data': index, 'metrics': metrics}
 
-    # print(str(df2.values[0][0]))
-    # print(''.join([df2.values[0][k] for k in check_columns_index]))
-    # print(df1[df1['检查重复'].isin([get_exists_dup(df2.values[0])])])
-    # df1.iloc[0, df.columns.get_loc('表演者2')] = 5
 
-    # print(strstrip(''.join([df2.values[0][k] for k in check_columns_index])))
-    # print(df2.values[0])
+def build_sqlite_match_index(file, db_file, check_columns, replace_columns, sheet_name=None, chunk_size=100000,
+                             is_digital=False, key_cache=None, metrics=None):
+    """
+    分块读取数据源文件，清理以后添加到 SqliteMatchIndex，用来处理不能一次载入内存的数据源
 
-    count = len(df2.values)
-    info = f'{"*" * 70}\n匹配总数: {count}，重复: {chongfu_count}，未找到: {count - chongfu_count - ignore_whitespace_count}，忽略空白: {ignore_whitespace_count}\n{"*" * 70}'
-    print(info)
+    db_file 已经存在的时候添加到文件中（比如每个月新的歌曲目录），不支持 multiple_results
+
+    :param file: 数据源文件（CSV 或 Excel），参考 read_file_chunks
+    :param db_file: SQLite 文件
+    :param check_columns: 检查条件
+    :param replace_columns: 要填充的内容
+    :param sheet_name: Excel 的表格名字
+    :param chunk_size: 每块的行数
+    :param is_digital: 数字版
+    :param key_cache: 检查重复内容的缓存，参考 get_key_cache
+    :param metrics: MatchMetrics 统计信息，为 None 的时候新建
+    :return: {'infos': infos, 'data': index, 'metrics': metrics}
+    """
+    infos = []
+    if metrics is None:
+        metrics = MatchMetrics()
+    key_cache = get_key_cache(key_cache)
+    index = SqliteMatchIndex(db_file, replace_columns)
+
+    dtype = {col: str for col in check_columns}
+    new_count = 0
+    for df_data in read_file_chunks(file, chunk_size=chunk_size, sheet_name=sheet_name, dtype=dtype):
+        metrics.count('build_sqlite_match_index.rows', len(df_data))
+        r = cleaning_data(df_data, is_digital=is_digital, dropna_subset=check_columns, exists_subset=check_columns,
+                          astype_str_list=check_columns, key_cache=key_cache, metrics=metrics)
+        infos.extend(r['infos'])
+        with metrics.stage('build_sqlite_match_index.append'):
+            new_count += index.append(r['data'])
+    metrics.count('build_sqlite_match_index.new_keys', new_count)
+
+    info = f'添加数据源索引: {db_file}，新增: {new_count}，总数: {len(index)}，冲突: {index.conflicts}'
+    logger.info(info)
+    infos.append(info)
+
+    return {'infos': infos, 'data': index, 'metrics': metrics}
+
+
+def _fill_in_sheet(sheet_name, df_data, check_columns, replace_columns, is_digital, fuzzy_threshold, max_conflict_examples,
+                   conflict_export, index, key_cache):
+    """清理并匹配一个表格的数据"""
+    infos = []
+    metrics = MatchMetrics()
+
+    logger.info('清理表格 “%s” 的数据', sheet_name)
+    r = cleaning_data(df_data, is_digital=is_digital, dropna_subset=None,
+                      astype_str_list=check_columns, replace_columns=None, metrics=metrics)
+    df_data = r['data']
+    infos.extend(r['infos'])
+
+    # 匹配两个文件中的数据 并把第一个文件内容填充到第二个文件
+    info = f'匹配表薄: {sheet_name}，行数: {len(df_data)}'
+    logger.info(info)
     infos.append(info)
+    r = match_data(None, df_data, check_columns, replace_columns, is_digital=is_digital, index=index, key_cache=key_cache,
+                   fuzzy_threshold=fuzzy_threshold, metrics=metrics, max_conflict_examples=max_conflict_examples,
+                   conflict_export=conflict_export)
+    infos.extend(r['infos'])
+
+    return {'infos': infos, 'data': r['data'], 'metrics': metrics, 'matched': r['matched'], 'conflicts': r['conflicts']}
 
-    return {'infos': infos, 'data': df2}
 
+def get_row_fingerprints(df, columns):
+    """
+    计算每行内容的指纹，用来判断行的内容有没有修改
+
+    :param df: DataFrame
+    :param columns: 计算指纹的列
+    :return: numpy uint64 数组
+    """
+    return pandas.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+def _fill_in_sheet_incremental(sheet_name, df_data, check_columns, replace_columns, is_digital, fuzzy_threshold,
+                               max_conflict_examples, conflict_export, previous, index, key_cache, score_column='匹配相似度'):
+    """
+    增量匹配一个表格的数据，只清理和匹配新增或修改的行，其他的行使用上次的结果
 
-def fill_in_the_matched_data(df, data, check_columns, replace_columns, is_digital=False, multiple_results=False):
+    :param previous: 上次保存的状态，以行指纹为索引的 DataFrame（'found' 列和填充的列），为 None 的时候匹配全部的行
+    :return: {'infos': infos, 'data': df_data, 'metrics': metrics, 'conflicts': conflicts, 'state': 这次的状态}
+    """
+    infos = []
+    metrics = MatchMetrics()
+    conflicts = ConflictReport(max_examples=max_conflict_examples, keep_all=conflict_export)
+
+    with metrics.stage('incremental.fingerprint'):
+        fingerprints = get_row_fingerprints(df_data, check_columns)
+        positions = numpy.full(len(df_data), -1)
+        if previous is not None and len(previous):
+            positions = previous.index.get_indexer(fingerprints)
+    reuse = numpy.flatnonzero(positions >= 0)
+    changed = numpy.flatnonzero(positions < 0)
+    metrics.count('incremental.reused', len(reuse))
+    metrics.count('incremental.changed', len(changed))
+
+    info = f'增量匹配表薄: {sheet_name}，使用上次的结果: {len(reuse)} 行，重新匹配: {len(changed)} 行'
+    logger.info(info)
+    infos.append(info)
+
+    columns = list(replace_columns) + ([score_column] if fuzzy_threshold else [])
+    parts = []
+    found = numpy.zeros(len(df_data), dtype=bool)
+
+    # 新增或修改的行：和 _fill_in_sheet 相同
+    if len(changed) or not len(reuse):
+        r = _fill_in_sheet(sheet_name, df_data.iloc[changed], check_columns, replace_columns, is_digital, fuzzy_threshold,
+                           max_conflict_examples, conflict_export, index=index, key_cache=key_cache)
+        infos.extend(r['infos'])
+        metrics.merge(r['metrics'])
+        conflicts.merge(r['conflicts'])
+        found[changed[r['matched']]] = True
+        parts.append(r['data'])
+
+    # 没有修改的行：只转换内容，不清理“检查重复”，使用上次匹配到的内容
+    if len(reuse):
+        with metrics.stage('incremental.reuse'):
+            r = cleaning_data(df_data.iloc[reuse], is_digital=is_digital, dropna_subset=None,
+                              astype_str_list=check_columns, replace_columns=None, metrics=metrics)
+            reused = r['data'].fillna(value='')
+            for col in columns:
+                if col not in reused.columns:
+                    reused[col] = ''
+            previous_rows = previous.iloc[positions[reuse]]
+            previous_found = previous_rows['found'].to_numpy(dtype=bool)
+            found[reuse[previous_found]] = True
+            for col in columns:
+                column_values = reused[col].to_numpy(dtype=object, copy=True)
+                column_values[previous_found] = previous_rows[col].to_numpy(dtype=object)[previous_found]
+                reused[col] = column_values
+        parts.append(reused[parts[0].columns] if parts else reused)
+
+    # 按原来的行的顺序合并
+    if len(parts) > 1:
+        order = numpy.argsort(numpy.concatenate([changed, reuse]), kind='stable')
+        df_data = pandas.concat(parts).iloc[order]
+    else:
+        df_data = parts[0]
+
+    # 这次的状态：相同指纹的行匹配结果相同，只保存一次，没有匹配到的行不保存内容
+    with metrics.stage('incremental.state'):
+        state = pandas.DataFrame({'found': found}, index=pandas.Index(fingerprints, name='fingerprint'))
+        for col in columns:
+            state[col] = numpy.where(found, df_data[col].to_numpy(dtype=object), '')
+        state = state[~state.index.duplicated(keep='first')]
+
+    return {'infos': infos, 'data': df_data, 'metrics': metrics, 'conflicts': conflicts, 'state': state}
+
+
+def get_match_state(state_file, source_fingerprint):
+    """
+    读取增量匹配的状态文件
+
+    :param state_file: 状态文件
+    :param source_fingerprint: 数据源和匹配参数的指纹，和保存的不同的时候不使用以前的状态
+    :return: {表格名字: 状态 DataFrame}，不能使用的时候返回 {}
+    """
+    if not os.path.exists(state_file):
+        return {}
+    try:
+        state = load_pickle(state_file)
+    except Exception as e:
+        logger.warning('读取增量匹配状态失败: %s %s', state_file, e)
+        return {}
+    if state.get('version') != MATCH_STATE_VERSION or state.get('source') != source_fingerprint:
+        return {}
+    return state['sheets']
+
+
+def _mark_duplicate_sheet(sheet_name, df_data, check_columns, is_digital, index, key_cache):
+    """清理一个表格的数据并标记重复"""
+    infos = []
+    metrics = MatchMetrics()
+
+    logger.info('清理表格 “%s” 的数据', sheet_name)
+    r = cleaning_data(df_data, is_digital=is_digital, dropna_subset=None,
+                      astype_str_list=check_columns, replace_columns=None, metrics=metrics)
+    infos.extend(r['infos'])
+    df_data = r['data']
+
+    # 匹配两个文件中的数据 并把第一个文件内容存在第二个文件的数据标记重复
+    logger.info('-' * 70)
+    info = f'标记重复数据 表薄: {sheet_name}，行数: {len(df_data)}'
+    logger.info(info)
+    infos.append(info)
+    # 默认标记重复
+    r = add_duplicate_tags(None, df_data, check_columns=check_columns, is_digital=is_digital, key_cache=key_cache, index=index,
+                           metrics=metrics)
+    infos.extend(r['infos'])
+
+    return {'infos': infos, 'data': r['data'], 'metrics': metrics}
+
+
+# 多进程处理表格的时候，每个进程只接收一次索引
+_worker_index = None
+_worker_key_cache = None
+
+
+def _init_sheet_worker(index, use_key_cache):
+    global _worker_index, _worker_key_cache
+    _worker_index = index
+    _worker_key_cache = KeyCache() if use_key_cache else None
+
+
+def _run_sheet_worker(func, args):
+    return func(*args, index=_worker_index, key_cache=_worker_key_cache)
+
+
+def _map_sheets(func, args_list, index, key_cache, workers=None):
+    """
+    处理多个表格，workers 大于 1 的时候使用多进程，结果按表格的顺序返回
+
+    多进程的时候每个进程使用自己的 key_cache
+    """
+    if not workers or workers <= 1 or len(args_list) <= 1:
+        for args in args_list:
+            yield func(*args, index=index, key_cache=key_cache)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(args_list)), initializer=_init_sheet_worker,
+                             initargs=(index, key_cache is not None)) as executor:
+        futures = [executor.submit(_run_sheet_worker, func, args) for args in args_list]
+        for future in futures:
+            yield future.result()
+
+
+def fill_in_the_matched_data(df, data, check_columns, replace_columns, is_digital=False, multiple_results=False, key_cache=None,
+                             unique_results=False, index_cache_dir=None, workers=None, fuzzy_threshold=None, index=None,
+                             state_file=None, max_conflict_examples=20, conflict_export=False):
     """
     填充匹配到的数据
 
@@ -339,92 +1645,204 @@ def fill_in_the_matched_data(df, data, check_columns, replace_columns, is_digita
     :param replace_columns: 要填充的内容
     :param is_digital: 数字版
     :param multiple_results: 填充匹配到的多个结果
-    :return:
+    :param key_cache: 检查重复内容的缓存，参考 get_key_cache，所有表格共用
+    :param unique_results: 填充多个结果的时候，去掉同一个键中重复的内容
+    :param index_cache_dir: 保存数据源索引的缓存，参考 build_match_index
+    :param workers: 多进程处理表格的进程数，为 None 或 1 的时候不使用多进程
+    :param fuzzy_threshold: 模糊匹配的相似度阈值，参考 match_data
+    :param index: 已经建立好的 MatchIndex 或 SqliteMatchIndex，不为 None 的时候不使用 df
+    :param state_file: 增量匹配的状态文件，保存每行 check_columns 的指纹和匹配结果，再次运行的时候只匹配新增或修改的行，
+                       数据源或参数变化的时候重新匹配全部的行。使用以前结果的行不会再次输出冲突内容
+    :param max_conflict_examples: 冲突内容在 infos 中最多显示的数量，参考 ConflictReport
+    :param conflict_export: 保存全部的冲突内容，可以用 r['conflicts'].to_dataframe() 导出
+    :return: {'infos': infos, 'data': data, 'metrics': metrics, 'conflicts': conflicts}
     """
 
     infos = []
+    key_cache = get_key_cache(key_cache)
+    metrics = MatchMetrics()
+    conflicts = ConflictReport(max_examples=max_conflict_examples, keep_all=conflict_export)
+
+    # 数据源只需要建立一次索引，所有表格共用
+    if index is None:
+        r = build_match_index(df, check_columns, replace_columns, is_digital=is_digital, multiple_results=multiple_results,
+                              unique_results=unique_results, key_cache=key_cache, index_cache_dir=index_cache_dir,
+                              metrics=metrics)
+        index = r['data']
+        infos.extend(r['infos'])
 
-    r = cleaning_data(df, is_digital=is_digital, dropna_subset=check_columns, exists_subset=check_columns,
-                      astype_str_list=check_columns, multiple_results=multiple_results,
-                      replace_columns=replace_columns)
-    df = r['data']
-    info = r['infos']
-    # print(info)
-    infos.extend(info)
-
-    # print(df.columns)
-    print('——' * 30)
-    print('填充匹配到的数据......')
-    info = f'数据源数量: {len(df)}'
-    print(info)
+    logger.info('——' * 30)
+    logger.info('填充匹配到的数据......')
+    info = f'数据源数量: {index.source_count}'
+    logger.info(info)
     infos.append(info)
+
+    # 模糊匹配的索引也只建立一次
+    if fuzzy_threshold:
+        with metrics.stage('match_data.fuzzy_index'):
+            index.fuzzy_index(fuzzy_threshold)
+
     # 处理多表文件（匹配并替换内容）
-    for sheet_name, df_data in data.items():
-        print(f'清理表格 “{sheet_name}” 的数据')
-        r = cleaning_data(df_data, is_digital=is_digital, dropna_subset=None,
-                          astype_str_list=check_columns, replace_columns=None)
-        df_data = r['data']
-        info = r['infos']
-        # print(info)
-        infos.extend(info)
-
-        # # 清理没有歌曲名和作者的行
-        # df_data = df_data.dropna(how='all', subset = ['歌曲名称','表演者'])
-        # # 转换表格为字符串
-        # df_data["歌曲名称"] = df_data["歌曲名称"].astype(str)
-
-        # 匹配两个文件中的数据 并把第一个文件内容填充到第二个文件
-        info = f'匹配表薄: {sheet_name}，行数: {len(df_data)}'
-        print(info)
+    if state_file is None:
+        args_list = [(sheet_name, df_data, check_columns, replace_columns, is_digital, fuzzy_threshold, max_conflict_examples,
+                      conflict_export) for sheet_name, df_data in data.items()]
+        for sheet_name, r in zip(data.keys(), _map_sheets(_fill_in_sheet, args_list, index, key_cache, workers)):
+            infos.extend(r['infos'])
+            data[sheet_name] = r['data']
+            metrics.merge(r['metrics'])
+            conflicts.merge(r['conflicts'])
+    else:
+        source_fingerprint = str({'index': index.fingerprint(), 'check_columns': list(check_columns),
+                                  'is_digital': is_digital, 'fuzzy_threshold': fuzzy_threshold,
+                                  'replace_list': REPLACE_LIST, 'clean_str': CLEAN_STR})
+        previous_sheets = get_match_state(state_file, source_fingerprint)
+        if not previous_sheets:
+            info = f'没有可以使用的增量匹配状态，匹配全部的行: {state_file}'
+            logger.info(info)
+            infos.append(info)
+
+        args_list = [(sheet_name, df_data, check_columns, replace_columns, is_digital, fuzzy_threshold, max_conflict_examples,
+                      conflict_export, previous_sheets.get(sheet_name)) for sheet_name, df_data in data.items()]
+        sheets_state = {}
+        for sheet_name, r in zip(data.keys(), _map_sheets(_fill_in_sheet_incremental, args_list, index, key_cache, workers)):
+            infos.extend(r['infos'])
+            data[sheet_name] = r['data']
+            metrics.merge(r['metrics'])
+            conflicts.merge(r['conflicts'])
+            sheets_state[sheet_name] = r['state']
+
+        save_pickle({'version': MATCH_STATE_VERSION, 'source': source_fingerprint, 'sheets': sheets_state}, state_file)
+        info = f'保存增量匹配状态: {state_file}'
+        logger.info(info)
         infos.append(info)
-        r = match_data(df, df_data, check_columns, replace_columns, is_digital=is_digital)
+
+    if key_cache is not None:
+        info = f'检查重复缓存 {key_cache}'
+        logger.info(info)
+        infos.append(info)
+
+    return {'infos': infos, 'data': data, 'metrics': metrics, 'conflicts': conflicts}
+
+
+def fill_in_the_matched_file(df, file, save_file, check_columns, replace_columns, sheet_name=None, chunk_size=100000,
+                             is_digital=False, multiple_results=False, unique_results=False, key_cache=None, index_cache_dir=None,
+                             index=None, max_conflict_examples=20, conflict_export=False):
+    """
+    分块填充匹配到的数据，用来处理不能一次载入内存的大文件
+
+    数据源只建立一次索引，要填充的文件每次读取、清理、匹配、写入 chunk_size 行，
+    内存占用是索引加上一块数据，和要填充的文件大小无关
+
+    :param df: 文件 1（数据源），传入 index 的时候可以为 None
+    :param file: 文件 2，Excel 或 CSV 文件
+    :param save_file: 保存结果的文件，Excel 或 CSV 文件（超过 Excel 最大行数的时候请使用 CSV）
+    :param check_columns: 检查条件
+    :param replace_columns: 要填充的内容
+    :param sheet_name: 文件 2 的表名，默认读取第一个表
+    :param chunk_size: 每块的行数
+    :param is_digital: 数字版
+    :param multiple_results: 填充匹配到的多个结果
+    :param unique_results: 填充多个结果的时候，去掉同一个键中重复的内容
+    :param key_cache: 检查重复内容的缓存，参考 get_key_cache
+    :param index_cache_dir: 保存数据源索引的缓存，参考 build_match_index
+    :param index: 已经建立好的 MatchIndex 或 SqliteMatchIndex
+    :param max_conflict_examples: 冲突内容在 infos 中最多显示的数量，参考 ConflictReport
+    :param conflict_export: 保存全部的冲突内容，可以用 r['conflicts'].to_dataframe() 导出
+    :return: {'infos': infos, 'data': save_file, 'metrics': metrics, 'conflicts': conflicts}
+    """
+
+    infos = []
+    key_cache = get_key_cache(key_cache)
+    metrics = MatchMetrics()
+    conflicts = ConflictReport(max_examples=max_conflict_examples, keep_all=conflict_export)
+
+    if index is None:
+        r = build_match_index(df, check_columns, replace_columns, is_digital=is_digital, multiple_results=multiple_results,
+                              unique_results=unique_results, key_cache=key_cache, index_cache_dir=index_cache_dir,
+                              metrics=metrics)
+        index = r['data']
         infos.extend(r['infos'])
-        data[sheet_name] = r['data']
 
-    return {'infos': infos, 'data': data}
+    logger.info('——' * 30)
+    logger.info('分块填充匹配到的数据......')
+    info = f'数据源数量: {index.source_count}'
+    logger.info(info)
+    infos.append(info)
+
+    # CSV 检查的列按字符串读取，每块的内容类型相同
+    dtype = {col: str for col in check_columns}
+    with ChunkWriter(save_file) as writer:
+        for i, df_data in enumerate(read_file_chunks(file, chunk_size=chunk_size, sheet_name=sheet_name, dtype=dtype)):
+            r = cleaning_data(df_data, is_digital=is_digital, dropna_subset=None,
+                              astype_str_list=check_columns, replace_columns=None, metrics=metrics)
+            infos.extend(r['infos'])
+
+            info = f'匹配第 {i + 1} 块，行数: {len(r["data"])}'
+            logger.info(info)
+            infos.append(info)
+            r = match_data(None, r['data'], check_columns, replace_columns, is_digital=is_digital, index=index, key_cache=key_cache,
+                           metrics=metrics, max_conflict_examples=max_conflict_examples, conflict_export=conflict_export)
+            infos.extend(r['infos'])
+            conflicts.merge(r['conflicts'])
+            with metrics.stage('fill_in_the_matched_file.save'):
+                writer.write(r['data'])
+
+    info = f'匹配完成，总行数: {writer.count}，保存文件: {save_file}'
+    logger.info(info)
+    infos.append(info)
+
+    if key_cache is not None:
+        info = f'检查重复缓存 {key_cache}'
+        logger.info(info)
+        infos.append(info)
+
+    return {'infos': infos, 'data': save_file, 'metrics': metrics, 'conflicts': conflicts}
 
 
-def mark_duplicate(df, data, check_columns, is_digital=False):
+def mark_duplicate(df, data, check_columns, is_digital=False, key_cache=None, index_cache_dir=None, workers=None, index=None):
     """
     标记重复
+
+    :param key_cache: 检查重复内容的缓存，参考 get_key_cache，所有表格共用
+    :param index_cache_dir: 保存数据源索引的缓存，参考 build_match_index
+    :param workers: 多进程处理表格的进程数，为 None 或 1 的时候不使用多进程
+    :param index: 已经建立好的 MatchIndex 或 SqliteMatchIndex，不为 None 的时候不使用 df
+    :return: {'infos': infos, 'data': data, 'metrics': metrics}
     """
 
     infos = []
+    key_cache = get_key_cache(key_cache)
+    metrics = MatchMetrics()
+
+    # 数据源只需要建立一次索引，所有表格共用
+    if index is None:
+        r = build_match_index(df, check_columns, [], is_digital=is_digital, key_cache=key_cache, index_cache_dir=index_cache_dir,
+                              metrics=metrics)
+        index = r['data']
+        infos.extend(r['infos'])
 
-    r = cleaning_data(df, is_digital=is_digital, dropna_subset=check_columns, exists_subset=check_columns,
-                      astype_str_list=check_columns, replace_columns=None)
-    infos.extend(r['infos'])
-    df = r['data']
-    # print(df.columns)
-
-    print('——' * 30)
-    print('开始标记重复内容......')
-    info = f'数据源数量: {len(df)}'
-    print(info)
+    logger.info('——' * 30)
+    logger.info('开始标记重复内容......')
+    info = f'数据源数量: {index.source_count}'
+    logger.info(info)
     infos.append(info)
 
     # 处理多表文件（匹配并替换内容）
-    for sheet_name, df_data in data.items():
-        print(f'清理表格 “{sheet_name}” 的数据')
-        r = cleaning_data(df_data, is_digital=is_digital, dropna_subset=None,
-                          astype_str_list=check_columns, replace_columns=None)
+    args_list = [(sheet_name, df_data, check_columns, is_digital) for sheet_name, df_data in data.items()]
+    for sheet_name, r in zip(data.keys(), _map_sheets(_mark_duplicate_sheet, args_list, index, key_cache, workers)):
         infos.extend(r['infos'])
-        df_data = r['data']
+        data[sheet_name] = r['data']
+        metrics.merge(r['metrics'])
 
-        # 匹配两个文件中的数据 并把第一个文件内容存在第二个文件的数据标记重复
-        print('-' * 70)
-        info = f'标记重复数据 表薄: {sheet_name}，行数: {len(df_data)}'
-        print(info)
+    if key_cache is not None:
+        info = f'检查重复缓存 {key_cache}'
+        logger.info(info)
         infos.append(info)
-        # 默认标记重复
-        r = add_duplicate_tags(df, df_data, check_columns=check_columns, is_digital=is_digital)
-        infos.extend(r['infos'])
-        data[sheet_name] = r['data']
 
-    return {'infos': infos, 'data': data}
+    return {'infos': infos, 'data': data, 'metrics': metrics}
 
 
-def check_duplicate_content(data, check_columns, keep='first', is_duplicate=True, is_digital=False):
+def check_duplicate_content(data, check_columns, keep='first', is_duplicate=True, is_digital=False, is_global=False):
     """
     标记单个文件中的重复行
 
@@ -433,17 +1851,26 @@ def check_duplicate_content(data, check_columns, keep='first', is_duplicate=True
     check_columns = ['歌曲名称', '表演者', '词作者', '曲作者', '内部采购子合同编号']  # , '专辑名称', '厂牌名称'
     data = check_duplicate_content(data, check_columns, keep='first', is_duplicate=True)
 
+    # 检查所有表格之间的重复，多个文件可以把表格放在一个字典中
+    data = {f'{file} {sheet_name}': df for file in files for sheet_name, df in get_excel_file_to_dfs(file).items()}
+    data = check_duplicate_content(data, check_columns, is_global=True)
+
     :param data: 检查重复数据
     :param check_columns: 需要检查重复的字段列表
     :param keep: 'first'：除了第一个之外，将重复标记为“True”(duplicated 默认)，'last'：除了最后一个之外，Mark重复为“True”，False ：将所有重复项标记为“True”
     :param is_duplicate: 是否保留判断重复的列
     :param is_digital:
+    :param is_global: 检查所有表格之间的重复，参考 check_duplicate_content_global
     :return:
     """
 
+    if is_global:
+        return check_duplicate_content_global(data, check_columns, keep=keep, is_duplicate=is_duplicate,
+                                              is_digital=is_digital)
+
     infos = []
 
-    print('开始标记单文件重复内容...')
+    logger.info('开始标记单文件重复内容...')
 
     for sheet_name, df_data in data.items():
         # df_data['重复'] = df_data.duplicated()
@@ -456,7 +1883,7 @@ def check_duplicate_content(data, check_columns, keep='first', is_duplicate=True
         infos.extend(r['infos'])
         # print(df_data.columns)
         df_data['重复'] = df_data.duplicated(['检查重复'], keep=keep)  # 指定特定的列，默认所有列
-        print(df_data.columns)
+        logger.debug('%s', df_data.columns)
 
         if is_duplicate:
             data[sheet_name] = df_data
@@ -470,6 +1897,89 @@ def check_duplicate_content(data, check_columns, keep='first', is_duplicate=True
     return {'infos': infos, 'data': data}
 
 
+def check_duplicate_content_global(data, check_columns, keep='first', is_duplicate=True, is_digital=False,
+                                   sheet_title='首次出现表格', row_title='首次出现行'):
+    """
+    标记所有表格之间的重复行
+
+    每个表格只清理一次，“检查重复”的内容放到一个共用的哈希表中，不合并成一个大的 DataFrame。
+    重复的行标记第一次出现的表格名字和行（DataFrame 的 index），表格的顺序就是 data 的顺序。
+    判断是不是同一行使用行的位置，index 有重复的时候也可以正确标记
+
+    :param data: 检查重复数据 {表格名字: df}
+    :param check_columns: 需要检查重复的字段列表
+    :param keep: 参考 check_duplicate_content，'first' 和 'last' 按所有表格的顺序判断
+    :param is_duplicate: 是否保留判断重复的列
+    :param is_digital:
+    :param sheet_title: 第一次出现的表格名字的列名
+    :param row_title: 第一次出现的行的列名
+    :return: {'infos': infos, 'data': data}
+    """
+
+    infos = []
+
+    logger.info('开始标记所有表格的重复内容...')
+
+    # 第一遍：清理每个表格，记录每个内容第一次、最后一次出现的表格、位置、行（index）和数量
+    first_sheet, first_position, first_row = {}, {}, {}
+    last_sheet, last_position = {}, {}
+    counts = {}
+    for sheet_name, df_data in data.items():
+        r = cleaning_data(df_data, is_digital=is_digital, dropna_subset=check_columns,
+                          exists_subset=check_columns, astype_str_list=check_columns, replace_columns=None)
+        df_data = r['data']
+        infos.extend(r['infos'])
+        data[sheet_name] = df_data
+
+        keys = df_data['检查重复']
+        positions = numpy.flatnonzero(~keys.duplicated(keep='first').to_numpy())
+        for key, position, row in zip(keys.to_numpy()[positions], positions, df_data.index[positions]):
+            if key not in first_sheet:
+                first_sheet[key] = sheet_name
+                first_position[key] = position
+                first_row[key] = row
+
+        if keep == 'last':
+            positions = numpy.flatnonzero(~keys.duplicated(keep='last').to_numpy())
+            last_keys = keys.to_numpy()[positions]
+            last_sheet.update(dict.fromkeys(last_keys, sheet_name))
+            last_position.update(zip(last_keys, positions))
+        elif keep is False:
+            for key, count in keys.value_counts(sort=False).items():
+                counts[key] = counts.get(key, 0) + count
+
+    # 第二遍：按哈希表标记重复
+    duplicate_count = 0
+    for sheet_name, df_data in data.items():
+        keys = df_data['检查重复']
+        sheets = keys.map(first_sheet)
+        rows = keys.map(first_row)
+        positions = numpy.arange(len(df_data))
+
+        if keep == 'first':
+            duplicate = (sheets != sheet_name) | (keys.map(first_position).to_numpy() != positions)
+        elif keep == 'last':
+            duplicate = (keys.map(last_sheet) != sheet_name) | (keys.map(last_position).to_numpy() != positions)
+        else:
+            duplicate = keys.map(counts) > 1
+
+        df_data['重复'] = numpy.asarray(duplicate, dtype=bool)
+        df_data[sheet_title] = sheets.astype(object).where(df_data['重复'], None)
+        df_data[row_title] = rows.astype(object).where(df_data['重复'], None)
+        duplicate_count += int(df_data['重复'].sum())
+
+        if is_duplicate:
+            data[sheet_name] = df_data
+        else:
+            data[sheet_name] = df_data.drop(columns=['检查重复'])  # 删除(检查重复)列
+
+    info = f'表格数量: {len(data)}，不重复内容数量: {len(first_sheet)}，重复行数: {duplicate_count}'
+    logger.info(info)
+    infos.append(info)
+
+    return {'infos': infos, 'data': data}
+
+
 def generated_file_path(excel_file, check_columns=None, replace_columns=None):
     """生成文件名字"""
     neme = ''
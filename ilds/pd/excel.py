@@ -4,6 +4,9 @@ from pathlib import Path
 import pandas as pd
 from ilds.file import get_dir_files
 from ilds.pd.read import get_df_list
+from ilds.log import get_logger
+
+logger = get_logger(__name__)
 
 
 def merging_excel_sheet(file, sheet_names=None, concat_columns=None, add_source_column=True, strict_mode=False, exclude_sheets=None, is_print=True, **concat_kwargs):
@@ -23,7 +26,7 @@ def merging_excel_sheet(file, sheet_names=None, concat_columns=None, add_source_
                           exclude_sheets=exclude_sheets, is_print=is_print)
     count = sum([len(df) for df in df_list])
     df = pd.concat(df_list, **concat_kwargs)  # result
-    print('合并数据行数：', len(df), '导入数据行数统计：', count)
+    logger.info('合并数据行数： %s 导入数据行数统计： %s', len(df), count)
     return df
 
 
@@ -52,7 +55,7 @@ def merging_excel_file_data(file_dir_or_file_list, ext='', sheet_names=None, con
 
     for file in file_list:
         if is_print:
-            print('处理文件:', file)
+            logger.info('处理文件: %s', file)
         df_list = get_df_list(file=file, sheet_names=sheet_names, concat_columns=concat_columns, add_source_column=add_source_column, strict_mode=strict_mode,
                               exclude_sheets=exclude_sheets, is_print=is_print)
         all_len += sum([len(df) for df in df_list])
@@ -62,7 +65,7 @@ def merging_excel_file_data(file_dir_or_file_list, ext='', sheet_names=None, con
     else:
         _df = pd.DataFrame()
     if is_print:
-        print('合并数据行数：', len(_df), '原始数据行数：', all_len)
+        logger.info('合并数据行数： %s 原始数据行数： %s', len(_df), all_len)
     return _df
 
 
@@ -82,11 +85,11 @@ def split_excel_sheet(file, dst_dir=None):
         for sheet_name in xlsx.sheet_names:
             df = xlsx.parse(sheet_name)
             to_file = dst_dir / f"{sheet_name},{file.suffix}"
-            print(f"保存表: {sheet_name}, 文件: {to_file}")
+            logger.info('保存表: %s, 文件: %s', sheet_name, to_file)
             with pd.ExcelWriter(to_file, engine='xlsxwriter') as writer:
                 df.to_excel(writer, sheet_name=sheet_name, index=False)
 
-    print(f"拆分完成，拆分文件保存在 '{dst_dir}' 文件夹中。")
+    logger.info("拆分完成，拆分文件保存在 '%s' 文件夹中。", dst_dir)
 
 
 def save_to_multiple_excel_files(df, filename_prefix, write_function, max_rows=1048576 - 2):
@@ -1,5 +1,13 @@
+import re
+
+import numpy as np
 import pandas as pd
 
+from ilds.file import save_pickle, load_pickle
+
+# 修改 NgramIndex 保存的内容以后需要修改版本
+NGRAM_INDEX_VERSION = 1
+
 OPERATOR_MAP = {
     'exact': '精确匹配',
     'iexact': '忽略大小写匹配',
@@ -8,15 +16,153 @@ OPERATOR_MAP = {
 }
 
 
-def match_dataframe(df, conditions):
+class NgramIndex:
+    """
+    一列内容的字符 n-gram 倒排索引，用来快速搜索包含关键字的行
+
+    索引使用小写的内容建立，每个 n-gram 保存包含它的行的位置（排序的数组）。
+    搜索的时候先求关键字所有 n-gram 的行位置的交集，再检查这些行是否真的包含关键字，
+    所以结果和 str.contains(keyword, regex=False) 相同。关键字比 n 短的时候检查全部的行
+
+    例子：
+    index = NgramIndex(df['歌曲名称'])
+    index.save('歌曲名称.ngram')
+    index = NgramIndex.load('歌曲名称.ngram')
+    df.iloc[index.contains('晴天')]
+    match_dataframe(df, [{'field': '歌曲名称', 'operator': 'icontains', 'value': '晴天'}], indexes={'歌曲名称': index})
+    """
+
+    def __init__(self, series, n=2):
+        """
+        :param series: 要搜索的列（pandas.Series），索引中保存行的位置，使用的时候行的顺序不能修改
+        :param n: n-gram 的长度
+        """
+        self.n = n
+        self.text = series.fillna('').map(str).to_numpy(dtype=object)
+        self._build()
+
+    def _build(self):
+        n = self.n
+        lower = pd.Series(self.text, dtype=object).str.lower()
+        lengths = lower.str.len().to_numpy()
+        row_dtype = np.int32 if len(lower) < 2 ** 31 else np.int64
+
+        # 每次取所有行相同位置的 n-gram
+        grams_list, rows_list = [], []
+        for start in range(int(lengths.max(initial=0)) - n + 1):
+            rows = np.flatnonzero(lengths >= start + n).astype(row_dtype)
+            grams_list.append(lower.iloc[rows].str.slice(start, start + n).to_numpy(dtype=object))
+            rows_list.append(rows)
+
+        if grams_list:
+            codes, grams = pd.factorize(np.concatenate(grams_list))
+            rows = np.concatenate(rows_list)
+            # 按 n-gram 和行的位置排序，去掉一行中重复的 n-gram
+            pairs = np.sort(codes.astype(np.int64) * len(lower) + rows)
+            pairs = pairs[np.concatenate([[True], pairs[1:] != pairs[:-1]])]
+            codes = pairs // len(lower)
+            self.positions = (pairs % len(lower)).astype(row_dtype)
+        else:
+            grams, codes = [], np.array([], dtype=np.int64)
+            self.positions = np.array([], dtype=row_dtype)
+
+        self.offsets = np.searchsorted(codes, np.arange(len(grams) + 1))
+        self.grams = {gram: i for i, gram in enumerate(grams)}
+
+    def __len__(self):
+        return len(self.text)
+
+    def save(self, file_path):
+        """保存索引到文件"""
+        save_pickle({'version': NGRAM_INDEX_VERSION, 'n': self.n, 'text': self.text, 'grams': self.grams,
+                     'offsets': self.offsets, 'positions': self.positions}, file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        从文件读取索引
+
+        :return: NgramIndex，版本不同的时候返回 None
+        """
+        data = load_pickle(file_path)
+        if data.get('version') != NGRAM_INDEX_VERSION:
+            return None
+        index = cls.__new__(cls)
+        index.n = data['n']
+        index.text = data['text']
+        index.grams = data['grams']
+        index.offsets = data['offsets']
+        index.positions = data['positions']
+        return index
+
+    def candidates(self, keyword):
+        """
+        获取可能包含关键字的行的位置（posting list 的交集）
+
+        :param keyword: 小写的关键字
+        :return: 排序的行位置数组，关键字比 n 短的时候为 None（需要检查全部的行）
+        """
+        n = self.n
+        if len(keyword) < n:
+            return None
+        postings = []
+        for gram in set(keyword[i:i + n] for i in range(len(keyword) - n + 1)):
+            code = self.grams.get(gram)
+            if code is None:
+                return self.positions[:0]
+            postings.append(self.positions[self.offsets[code]:self.offsets[code + 1]])
+
+        # 从最短的开始求交集
+        postings.sort(key=len)
+        result = postings[0]
+        for posting in postings[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, posting, assume_unique=True)
+        return result
+
+    def contains(self, keyword, case=True):
+        """
+        搜索包含关键字的行
+
+        :param keyword: 关键字（字面字符串，不是正则表达式）
+        :param case: 默认为 True，如果为 True 则区分大小写
+        :return: 排序的行位置数组（numpy）
+        """
+        keyword = str(keyword)
+        lower_keyword = keyword.lower()
+        rows = self.candidates(lower_keyword)
+        if rows is None:
+            rows = np.arange(len(self.text))
+
+        text = self.text[rows]
+        if case:
+            found = [keyword in t for t in text]
+        else:
+            found = [lower_keyword in t.lower() for t in text]
+        return rows[np.asarray(found, dtype=bool)] if len(rows) else rows
+
+    def contains_mask(self, keyword, case=True):
+        """搜索包含关键字的行，返回每行的布尔数组"""
+        mask = np.zeros(len(self.text), dtype=bool)
+        mask[self.contains(keyword, case=case)] = True
+        return mask
+
+
+def match_dataframe(df, conditions, indexes=None):
     """
     从Pandas数据中匹配满足特定条件的行
 
     :param df: 输入的 pandas 数据
     :param conditions: 字典列表，其中每个字典包含 field、operator（'exact', 'iexact', 'contains', 'icontains' 等）和比较的value。
                        可以选择添加 'convert_to_numeric': True 来尝试将字段转换为数字进行匹配。
+    :param indexes: {列名: NgramIndex}，'contains' 和 'icontains' 使用索引搜索，索引需要使用 df 的这一列建立。
+                    value 和 str.contains 一样是正则表达式，只有没有特殊字符（和字面字符串相同）的时候才使用索引
     :return: 满足条件的过滤后的数据
     """
+    if indexes is None:
+        indexes = {}
+
     # 初始条件为全True的布尔Series
     match_series = pd.Series([True] * len(df))
 
@@ -40,6 +186,13 @@ def match_dataframe(df, conditions):
                 match_series &= (df[field] == value)
             else:
                 raise ValueError(f"数字的匹配条件不支持: {OPERATOR_MAP.get(operator, operator)}")
+        elif (operator in ('contains', 'icontains') and field in indexes and isinstance(value, str) and value
+              and re.escape(value) == value):
+            # 空的 value 不使用索引，str.contains 的 na=False 不匹配空的内容
+            index = indexes[field]
+            if len(index) != len(df):
+                raise ValueError(f"“{field}”的索引行数 {len(index)} 和数据行数 {len(df)} 不同")
+            match_series &= index.contains_mask(value, case=operator == 'contains')
         else:
             # 字符串类型匹配，需要确保字段是字符串类型
             if not pd.api.types.is_string_dtype(df[field]):
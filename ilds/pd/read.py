@@ -1,12 +1,19 @@
 import os
 import hashlib
 from collections import OrderedDict
+from contextlib import ExitStack
 
-from ilds.file import get_dir_files, get_file_md5
+from ilds.file import (get_dir_files, get_file_md5, get_file_md5_cached, json_read, json_save, save_pickle,
+                       load_pickle)
+from ilds.log import get_logger
+from ilds.xlsx import probe_workbook, read_sheet_headers
+from ilds.cache import CacheManager, get_cache_manager, get_cache_key
 
 import pandas as pd
 from openpyxl import load_workbook
 
+logger = get_logger(__name__)
+
 
 def get_df_list(file, sheet_names=None, concat_columns=None, add_source_column=True, strict_mode=False, exclude_sheets=None, is_print=True):
     df_list = []
@@ -27,7 +34,7 @@ def get_df_list(file, sheet_names=None, concat_columns=None, add_source_column=T
         sheet_names = [sheet_name for sheet_name in sheet_names if sheet_name not in exclude_sheets]
 
         if is_print:
-            print('读取的表薄名称列表：', sheet_names, 'Excel表薄列表', excel.sheet_names)
+            logger.info('读取的表薄名称列表： %s Excel表薄列表 %s', sheet_names, excel.sheet_names)
         # 通过表薄名字读取表单
         # data['总表'] = pd.read_excel(excel, sheet_name='总表')
         # 读取全部表
@@ -35,7 +42,7 @@ def get_df_list(file, sheet_names=None, concat_columns=None, add_source_column=T
             _df = pd.read_excel(excel, sheet_name=sheet_name, header=0)
             # _df = pd.read_excel(excel, sheet_name=0, header=0)
             if is_print:
-                print('表薄名称：', sheet_name, '\t', '行数：', len(_df), '\t', '文件：', file)
+                logger.info('表薄名称： %s \t 行数： %s \t 文件： %s', sheet_name, len(_df), file)
             # if 'Metadatas' != sheet_name:
             #     print('跳过内容', sheet_name)
             #     continue
@@ -60,8 +67,31 @@ def get_df_list(file, sheet_names=None, concat_columns=None, add_source_column=T
     return df_list
 
 
+def get_read_excel_columns(headers):
+    """
+    把标题行转换为 pd.read_excel 的列名，和 pandas 相同：空的标题为 'Unnamed: 列号'，
+    重复的标题添加 '.1'、'.2' 等（先处理有名字的列，已经存在的名字跳过）
+
+    :param headers: 标题行的内容，参考 ilds.xlsx.read_sheet_headers
+    :return: 列名列表
+    """
+    unnamed = [i for i, header in enumerate(headers) if header is None or header == '']
+    columns = [f'Unnamed: {i}' if i in unnamed else header for i, header in enumerate(headers)]
+    counts = {}
+    for i in [i for i in range(len(columns)) if i not in unnamed] + unnamed:
+        col = old_col = columns[i]
+        count = counts.get(col, 0)
+        while count > 0:
+            counts[old_col] = count + 1
+            col = f'{old_col}.{count}'
+            count = count + 1 if col in columns else counts.get(col, 0)
+        columns[i] = col
+        counts[col] = count + 1
+    return columns
+
+
 def get_excel_data(file, sheet_names=None, columns=None, add_source_column=True, only_read_first_table=False, read_sheet_state=False,
-                   dtype_config=None, dtype_backend=None, is_print=True):
+                   dtype_config=None, dtype_backend=None, is_print=True, cache=False):
     """
     读取 Excel 数据
 
@@ -76,62 +106,132 @@ def get_excel_data(file, sheet_names=None, columns=None, add_source_column=True,
     :param dtype_config: 自定义列名到数据类型的映射字典。例如：{'UPC': str, 'ID': int}
     :param dtype_backend: 数据类型后端，比如 'pyarrow'
     :param is_print: 打印读取信息
+    :param cache: 每个表格分别缓存为 parquet 文件（不能保存为 parquet 的时候使用 pickle），True 使用 get_cache_manager()，也可以是 CacheManager。
+                  缓存的键是文件内容的哈希、表格名字、dtype_config 和 dtype_backend，全部的表格都有缓存的时候不打开 Excel 文件
     :return: {'file_name', 'index', 'sheet_name', 'sheet_names', 'count', 'columns', 'df'}
     """
     data = OrderedDict()
-
+    file_name = os.path.basename(file)
+
+    # 文件的表格名字和状态也保存在缓存中
+    cache_manager, file_hash, meta = None, None, {}
+    if cache:
+        cache_manager = cache if isinstance(cache, CacheManager) else get_cache_manager()
+        file_hash = get_file_md5_cached(file)
+        meta_key = get_cache_key('get_excel_data', file_hash)
+        meta_file = cache_manager.get('excel_meta', meta_key, '.json')
+        if meta_file is not None:
+            meta = json_read(meta_file, raise_error=False) or {}
+    old_meta = dict(meta)
+
+    sheet_state_data = {}
     if read_sheet_state:
-        try:
-            wb = load_workbook(file, read_only=False)
-            sheet_state_data = {name: wb[name].sheet_state for name in wb.sheetnames}
-            # print(sheet_state_data)
-            wb.close()
-        except Exception as e:
-            print('get_excel_data 读取表格状态失败', e)
-            sheet_state_data = {}
-    else:
-        sheet_state_data = {}
+        if meta.get('sheet_state') is not None:
+            sheet_state_data = meta['sheet_state']
+        else:
+            try:
+                # 只读取 xl/workbook.xml，不加载工作簿
+                sheet_state_data = {name: info['sheet_state']
+                                    for name, info in probe_workbook(file, read_sheet_head=False).items()}
+                meta['sheet_state'] = sheet_state_data
+            except Exception as e:
+                logger.warning('get_excel_data 读取表格状态失败 %s', e)
+
+    with ExitStack() as stack:
+        # 需要读取表格的时候才打开 Excel 文件
+        excel = None
+        if meta.get('sheet_names') is None:
+            excel = stack.enter_context(pd.ExcelFile(file))
+            meta['sheet_names'] = excel.sheet_names
+        all_sheet_names = meta['sheet_names']
 
-    with pd.ExcelFile(file) as excel:
         if sheet_names is None:
-            sheet_names = excel.sheet_names
+            sheet_names = all_sheet_names
         else:
             # 确保Excel文件中提供的 sheet_names 存在
-            invalid_sheets = set(sheet_names) - set(excel.sheet_names)
+            invalid_sheets = set(sheet_names) - set(all_sheet_names)
             if invalid_sheets:
                 raise ValueError(f"Excel 文件中不存在以下表格：{invalid_sheets}")
 
         if is_print:
-            print('读取的表薄名称列表：', sheet_names, 'Excel表薄列表', excel.sheet_names)
+            logger.info('读取的表薄名称列表： %s Excel表薄列表 %s', sheet_names, all_sheet_names)
 
         # 通过表薄名字读取表单
         # data['总表'] = pd.read_excel(excel, sheet_name='总表')
         # 读取全部表
+        sheet_headers = None
         for index, sheet_name in enumerate(sheet_names):
+            sheet_state = sheet_state_data.get(sheet_name, None)
 
-            # 读取数据以检查列名
-            temp_df = pd.read_excel(excel, sheet_name=sheet_name, nrows=0)
-
-            read_params = {'engine': 'openpyxl', 'sheet_name': sheet_name, 'header': 0, }
-
-            # 列中包含要自定义类型的列的时候才使用自定义
-            if dtype_config is not None:
-                dtype_override = {col: dtype for col, dtype in dtype_config.items() if col in temp_df.columns}
-                read_params['dtype'] = dtype_override
-
-            if dtype_backend:
-                read_params['dtype_backend'] = dtype_backend
-
-            if is_print:
-                print(f'读取Excel参数: {read_params}')
+            _df = None
+            if cache_manager is not None:
+                dtype_key = None if dtype_config is None else sorted((str(k), str(v)) for k, v in dtype_config.items())
+                sheet_key = get_cache_key(file_hash, sheet_name, dtype_key, dtype_backend)
+                # 不能保存为 parquet 的表格使用 pickle 缓存
+                suffix = '.pkl' if os.path.exists(cache_manager.path('excel', sheet_key, '.pkl')) else '.parquet'
+                cache_file = cache_manager.get('excel', sheet_key, suffix,
+                                               source_size=os.path.getsize(file) // len(all_sheet_names))
+                if cache_file is not None:
+                    if is_print:
+                        logger.info('从缓存载入表格: %s %s', sheet_name, cache_file)
+                    if suffix == '.pkl':
+                        _df = load_pickle(cache_file)
+                    elif dtype_backend:
+                        _df = pd.read_parquet(cache_file, dtype_backend=dtype_backend)
+                    else:
+                        _df = pd.read_parquet(cache_file)
+
+            if _df is None:
+                if excel is None:
+                    excel = stack.enter_context(pd.ExcelFile(file))
+
+                read_params = {'engine': 'openpyxl', 'sheet_name': sheet_name, 'header': 0, }
+
+                # 列中包含要自定义类型的列的时候才使用自定义
+                if dtype_config is not None:
+                    # 直接从 XML 读取标题行，不用 pandas 多解析一次表格
+                    if sheet_headers is None:
+                        try:
+                            sheet_headers = read_sheet_headers(file, sheet_names)
+                        except Exception as e:
+                            logger.debug('get_excel_data 从 XML 读取标题行失败 %s', e)
+                            sheet_headers = {}
+                    headers = sheet_headers.get(sheet_name)
+                    if headers is not None:
+                        headers = get_read_excel_columns(headers)
+                    else:
+                        # 不是 xlsx 文件的时候读取数据以检查列名
+                        headers = pd.read_excel(excel, sheet_name=sheet_name, nrows=0).columns
+                    dtype_override = {col: dtype for col, dtype in dtype_config.items() if col in headers}
+                    read_params['dtype'] = dtype_override
+
+                if dtype_backend:
+                    read_params['dtype_backend'] = dtype_backend
+
+                if is_print:
+                    logger.info('读取Excel参数: %s', read_params)
+
+                _df = pd.read_excel(excel, **read_params)
+
+                if cache_manager is not None:
+                    cache_file = cache_manager.path('excel', sheet_key, '.parquet')
+                    try:
+                        # parquet 把数字、日期等列名保存为文字，读取的时候列名会变，这些表格使用 pickle
+                        if not all(isinstance(col, str) for col in _df.columns):
+                            raise ValueError('列名不全是文字，不能保存为 parquet')
+                        _df.to_parquet(cache_file)
+                        cache_manager.put('excel', sheet_key, '.parquet')
+                    except Exception as e:
+                        # 比如一列中有数字和文字，或者列名有数字的时候不能保存为 parquet
+                        logger.debug('表格不能保存为 parquet，使用 pickle 缓存: %s %s', sheet_name, e)
+                        cache_manager.remove('excel', sheet_key, '.parquet')
+                        save_pickle(_df, cache_manager.path('excel', sheet_key, '.pkl'))
+                        cache_manager.put('excel', sheet_key, '.pkl')
 
-            sheet_state = sheet_state_data.get(sheet_name, None)
-            _df = pd.read_excel(excel, **read_params)
-            file_name = os.path.basename(file)
             count = len(_df)
 
             if is_print:
-                print('表薄名称：', sheet_name, '\t', '行数：', count, '\t', '文件：', file)
+                logger.info('表薄名称： %s \t 行数： %s \t 文件： %s', sheet_name, count, file)
 
             if add_source_column:
                 _df['本行来自'] = f"{file_name} - {sheet_name}"
@@ -157,6 +257,10 @@ def get_excel_data(file, sheet_names=None, columns=None, add_source_column=True,
 
             data[sheet_name] = df_data
 
+    if cache_manager is not None and meta != old_meta:
+        json_save(meta, cache_manager.path('excel_meta', meta_key, '.json'), raise_error=False)
+        cache_manager.put('excel_meta', meta_key, '.json')
+
     return data
 
 
@@ -176,33 +280,88 @@ def generate_cache_filename(file_path, file_hash, **read_excel_kwargs):
     return cache_file
 
 
-def load_excel_with_cache(file_path, **read_excel_kwargs):
+def load_excel_with_cache(file_path, cache=None, **read_excel_kwargs):
     """
     从缓存加载 Excel文件
 
     先根据文件内容和参数的哈希值生成缓存文件名，如果缓存文件存在直接读取，否则读取Excel文件并保存缓存
+    文件的大小、修改时间和 inode 没有变化的时候，使用保存的哈希值，不再读取整个文件，参考 get_file_md5_cached
+    缓存保存在共用的缓存文件夹中（excel 子文件夹），总大小超过限制的时候删除最久没有使用的缓存，参考 ilds.cache
+
+    :param file_path: Excel 文件
+    :param cache: CacheManager，默认使用 get_cache_manager()
+    :param read_excel_kwargs: pd.read_excel 的参数
     """
+    cache = cache or get_cache_manager()
     # 计算 Excel 文件的哈希值
-    file_hash = get_file_md5(file_path)
-    # 根据文件哈希和参数生成缓存文件名
-    cache_file = generate_cache_filename(file_path, file_hash, **read_excel_kwargs)
+    file_hash = get_file_md5_cached(file_path)
+    # 根据文件哈希和参数生成缓存的键
+    key = os.path.splitext(os.path.basename(generate_cache_filename(file_path, file_hash, **read_excel_kwargs)))[0]
 
     # 检查缓存文件是否存在
-    if os.path.exists(cache_file):
-        print(f"从缓存载入数据: {cache_file}")
+    cache_file = cache.get('excel', key, '.parquet', source_size=os.path.getsize(file_path))
+    if cache_file is not None:
+        logger.info('从缓存载入数据: %s', cache_file)
         return pd.read_parquet(cache_file)
 
     # 如果缓存不存在或文件内容改变，则从 Excel 文件加载
-    print(f"从 Excel 载入数据: {file_path}")
+    logger.info('从 Excel 载入数据: %s', file_path)
     df = pd.read_excel(file_path, dtype_backend='pyarrow', **read_excel_kwargs)
 
     # 保存 DataFrame 到缓存（包括文件哈希以供验证）
+    cache_file = cache.path('excel', key, '.parquet')
     df.to_parquet(cache_file)
-    print(f"保存到缓存: {cache_file}")
+    cache.put('excel', key, '.parquet')
+    logger.info('保存到缓存: %s', cache_file)
 
     return df
 
 
+def read_file_chunks(file, chunk_size=100000, sheet_name=None, dtype=None):
+    """
+    分块读取 Excel 或 CSV 文件，每次返回 chunk_size 行的 DataFrame，用来处理不能一次载入内存的大文件
+
+    Excel 使用 openpyxl 的只读模式按行读取，第一行是标题，和 pd.read_excel 一样忽略末尾的空行
+
+    :param file: Excel 或 CSV 文件
+    :param chunk_size: 每块的行数
+    :param sheet_name: Excel 的表名，默认读取第一个表
+    :param dtype: CSV 的列类型，例如：{'UPC': str}，分块读取的时候建议指定，让每块的类型相同
+    :return: DataFrame 的生成器
+    """
+    if str(file).lower().endswith('.csv'):
+        with pd.read_csv(file, chunksize=chunk_size, dtype=dtype) as reader:
+            for chunk in reader:
+                yield chunk
+        return
+
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name] if sheet_name is not None else wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        columns = list(next(rows, ()))
+        width = len(columns)
+        chunk = []
+        empty_rows = []
+        for row in rows:
+            row = list(row[:width]) + [None] * (width - len(row))
+            # 空行先保存起来，后面有内容的时候才添加
+            if all(v is None for v in row):
+                empty_rows.append(row)
+                continue
+            if empty_rows:
+                chunk.extend(empty_rows)
+                empty_rows = []
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk[:chunk_size], columns=columns)
+                chunk = chunk[chunk_size:]
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns)
+    finally:
+        wb.close()
+
+
 def read_song_ids(file_path, sheet_name=0, column='歌曲ID'):
     """
     读取Excel文件中的列的内容为列表
@@ -227,7 +386,7 @@ def read_song_ids(file_path, sheet_name=0, column='歌曲ID'):
 
         return song_ids
     except Exception as e:
-        print(f"读取Excel文件失败: {e}")
+        logger.warning('读取Excel文件失败: %s', e)
         return []
 
 
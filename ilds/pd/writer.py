@@ -105,6 +105,59 @@ def writer_excel(obj, path, index=False, use_zip64=False):
                 writer.book.use_zip64()
 
 
+class ChunkWriter:
+    """
+    分块写入 DataFrame 到 Excel 或 CSV 文件，内存中只保留当前的块
+
+    Excel 使用 openpyxl 的只写模式，单个表最多 1048576 行，更大的数据请保存为 CSV
+
+    # 使用上下文的例子：
+    with ChunkWriter("文件.xlsx") as writer:
+        for df in read_file_chunks(file):
+            writer.write(df)
+    """
+
+    def __init__(self, filename, sheet_name='Sheet1', encoding='utf-8-sig'):
+        self.filename = str(filename)
+        self.is_csv = self.filename.lower().endswith('.csv')
+        self.encoding = encoding
+        self.count = 0
+        self.columns = None
+        if not self.is_csv:
+            from openpyxl import Workbook
+            self.wb = Workbook(write_only=True)
+            self.ws = self.wb.create_sheet(sheet_name)
+
+    def write(self, df):
+        """写入一块数据，第一次写入的时候写入标题"""
+        if self.columns is None:
+            self.columns = list(df.columns)
+            if self.is_csv:
+                df.iloc[:0].to_csv(self.filename, index=False, encoding=self.encoding)
+            else:
+                self.ws.append([str(col) for col in self.columns])
+
+        if self.is_csv:
+            df.to_csv(self.filename, mode='a', header=False, index=False, encoding='utf-8')
+        else:
+            df = df.astype(object).where(df.notna(), None)
+            for row in df.itertuples(index=False, name=None):
+                self.ws.append(row)
+        self.count += len(df)
+
+    def close(self):
+        """保存文件"""
+        if not self.is_csv:
+            self.wb.save(self.filename)
+            self.wb.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
 def save_dict_list_to_excel(dicts_list, save_file, rename_columns=None, properties=None):
     """
     保存字典列表的数据为 Excel 文件
@@ -9,6 +9,9 @@
 #   说明：常用的函数集合
 # ---------------------------------------
 import os.path
+import re
+from collections import OrderedDict
+from functools import lru_cache
 
 from ilds.lib.configobj import ConfigObj
 
@@ -199,34 +202,174 @@ def get_config(file="./config.ini", key='file', ret_obj=False, default=''):
         return _value
 
 
-def cleaning_str(text, replace_list=None, reorder_string=False):
+def _replace_overlap(a, b):
+    """检查两个替换内容是否会重叠（包含，或者 a 的结尾是 b 的开头）"""
+    if b in a or a in b:
+        return True
+    return any(a.endswith(b[:k]) for k in range(1, len(b)))
+
+
+def _replace_independent(replace_list):
     """
-    清理字符中的多余符号
+    检查替换规则是否可以合并为一个正则表达式一次替换
 
-    :param text: 要处理的文本
-    :param replace_list: 替换指定的字符
-    :param reorder_string:重新排序字符串
-    :return:
+    按顺序替换的时候，前面规则替换的结果可能会被后面的规则再次替换，这种情况必须按顺序替换
+    """
+    for i, (old_i, new_i) in enumerate(replace_list):
+        if not old_i:
+            return False
+        for j, (old_j, new_j) in enumerate(replace_list):
+            if i == j:
+                continue
+            if _replace_overlap(old_i, old_j):
+                return False
+            # 后面的规则可能匹配到前面规则替换的结果，或者删除内容以后新连接起来的内容
+            if j > i and (set(old_j) & set(new_i) or (not new_i and len(old_j) > 1)):
+                return False
+    return True
+
+
+class StrCleaner:
     """
+    编译好的字符清理器，结果和 cleaning_str 相同
 
-    temp = text.strip().lower()
+    创建的时候编译一次：清除符号使用一次 str.translate，替换内容尽量合并为一个正则表达式
 
-    # 替换内容
+    例子：
+    cleaner = StrCleaner()
+    cleaner.normalize(' Hello (World) ')
+    cleaner.normalize_many(['a b', 'c|d'])
+    """
+
+    def __init__(self, replace_list=None, clean_str=CLEAN_STR, reorder_string=False):
+        """
+        :param replace_list: 替换指定的字符，默认使用 REPLACE_LIST
+        :param clean_str: 要清除的符号
+        :param reorder_string: 重新排序字符串
+        """
+        if replace_list is None:
+            replace_list = REPLACE_LIST
+        self.replace_list = [tuple(ch) for ch in replace_list]
+        self.reorder_string = reorder_string
+        self.table = str.maketrans('', '', ''.join(clean_str))
+
+        # 替换规则互不影响的时候，合并为一个正则表达式
+        self.pattern = None
+        if len(self.replace_list) > 1 and _replace_independent(self.replace_list):
+            self.replace_dict = dict(self.replace_list)
+            self.pattern = re.compile('|'.join(re.escape(old) for old, _ in self.replace_list))
+
+    def repl(self, match):
+        """正则表达式替换用的函数"""
+        return self.replace_dict[match.group()]
+
+    def replace(self, text):
+        """替换内容"""
+        if self.pattern is not None:
+            return self.pattern.sub(self.repl, text)
+        for ch in self.replace_list:
+            text = text.replace(*ch)
+        return text
+
+    def normalize(self, text):
+        """清理字符中的多余符号"""
+        temp = self.replace(text.strip().lower())
+        if self.reorder_string:
+            temp = ''.join(sorted(temp))
+        return temp.translate(self.table)
+
+    __call__ = normalize
+
+    def normalize_many(self, iterable):
+        """批量清理，返回列表"""
+        normalize = self.normalize
+        return [normalize(text) for text in iterable]
+
+
+@lru_cache(maxsize=32)
+def _get_str_cleaner(replace_list, reorder_string):
+    return StrCleaner(replace_list, reorder_string=reorder_string)
+
+
+def get_str_cleaner(replace_list=None, reorder_string=False):
+    """
+    获取编译好的 StrCleaner，相同的参数只编译一次
+    """
     if replace_list is None:
         replace_list = REPLACE_LIST
-    # print('替换内容', replace_list)
-    for ch in replace_list:
-        temp = temp.replace(*ch)
+    return _get_str_cleaner(tuple(tuple(ch) for ch in replace_list), reorder_string)
 
-    # 重新排序
-    if reorder_string:
-        temp = ''.join(sorted(temp))
 
-    # 清除符号
-    for ch in CLEAN_STR:
-        temp = temp.replace(ch, '')
+class KeyCache:
+    """
+    有大小限制的清理结果缓存（LRU），用在重复内容很多的数据
+
+    例子：
+    key_cache = KeyCache(maxsize=100000)
+    key_cache.normalize('Hello World')
+    print(key_cache.hits, key_cache.misses)
+    """
 
-    return temp
+    def __init__(self, cleaner=None, maxsize=1000000):
+        """
+        :param cleaner: StrCleaner，默认使用 get_str_cleaner()
+        :param maxsize: 最多缓存的数量，为 None 的时候不限制
+        """
+        self.cleaner = cleaner or get_str_cleaner()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    def normalize(self, text):
+        """清理字符中的多余符号，使用缓存"""
+        cache = self._cache
+        try:
+            value = cache[text]
+        except KeyError:
+            self.misses += 1
+            value = cache[text] = self.cleaner.normalize(text)
+            if self.maxsize is not None and len(cache) > self.maxsize:
+                cache.popitem(last=False)
+            return value
+        self.hits += 1
+        cache.move_to_end(text)
+        return value
+
+    __call__ = normalize
+
+    def normalize_many(self, iterable):
+        """批量清理，返回列表"""
+        normalize = self.normalize
+        return [normalize(text) for text in iterable]
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        """清空缓存和计数"""
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """缓存信息"""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache), 'maxsize': self.maxsize}
+
+    def __str__(self):
+        return f'命中: {self.hits}，未命中: {self.misses}，缓存数量: {len(self._cache)}'
+
+
+def cleaning_str(text, replace_list=None, reorder_string=False):
+    """
+    清理字符中的多余符号
+
+    :param text: 要处理的文本
+    :param replace_list: 替换指定的字符
+    :param reorder_string:重新排序字符串
+    :return:
+    """
+    return get_str_cleaner(replace_list, reorder_string).normalize(text)
 
 
 def cleaning_digital(_str):
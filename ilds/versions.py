@@ -1,4 +1,4 @@
-version = '3.0.0'
+version = '3.1.0'
 
 # 因为日期格式问题，所以下面的版本号不能使用
 # 主版本号 (Major Version): 较大的功能变化或结构调整
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+#
+# ---------------------------------------
+#   程序：xlsx.py
+#   版本：0.1
+#   作者：lds
+#   日期：2026-10-18
+#   语言：Python 3.X
+#   说明：直接从 xlsx 压缩包的 XML 读取表格信息，不加载整个工作簿
+# ---------------------------------------
+
+"""
+xlsx 文件是 zip 压缩包，表格名字在 xl/workbook.xml 中，每个表格的内容在 xl/worksheets/sheetN.xml 中，
+文字保存在 xl/sharedStrings.xml 中。这里只流式读取需要的部分，读完第一行就停止，大文件也很快
+
+例子：
+from ilds.xlsx import probe_workbook, read_sheet_headers
+info = probe_workbook('歌曲.xlsx')
+print(info['Sheet1'])  # {'index': 0, 'sheet_name': 'Sheet1', 'sheet_state': 'visible', 'max_row': 3000, ...}
+
+headers = read_sheet_headers('歌曲.xlsx')
+print(headers['Sheet1'])  # ['歌曲名称', '表演者', ...]
+"""
+
+import re
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+
+from openpyxl.formula.translate import Translator
+from openpyxl.styles.numbers import builtin_format_code, is_date_format, is_timedelta_format
+from openpyxl.utils.datetime import from_excel, from_ISO8601, CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900
+
+WORKBOOK_PATH = 'xl/workbook.xml'
+WORKBOOK_RELS_PATH = 'xl/_rels/workbook.xml.rels'
+SHARED_STRINGS_PATH = 'xl/sharedStrings.xml'
+STYLES_PATH = 'xl/styles.xml'
+
+
+def _local(tag):
+    """去掉 XML 命名空间，strict 格式的命名空间和普通格式不同"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _column_index(ref):
+    """单元格位置的列号（从 0 开始），比如 'C1' 返回 2"""
+    index = 0
+    for char in re.match(r'[A-Z]*', ref).group():
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+
+def _parse_dimension(ref):
+    """
+    转换 <dimension> 的范围
+
+    :param ref: 比如 'A1:C3000' 或者 'A1'
+    :return: (max_row, max_column)，没有范围的时候返回 (None, None)
+    """
+    match = re.fullmatch(r'(?:[A-Z]+\d+:)?([A-Z]+)(\d+)', ref or '')
+    if match is None:
+        return None, None
+    return int(match.group(2)), _column_index(match.group(1)) + 1
+
+
+def _text(elem):
+    """
+    获取 <si> 或者 <is> 中的文字，富文本的每一段都在 <r><t> 中，不包括注音 <rPh>
+    """
+    texts = []
+    for child in elem:
+        tag = _local(child.tag)
+        if tag == 't':
+            texts.append(child.text or '')
+        elif tag == 'r':
+            texts.extend(t.text or '' for t in child if _local(t.tag) == 't')
+    return ''.join(texts)
+
+
+def _read_workbook(zf):
+    """
+    读取工作簿中的表格、共享文字和样式的路径、日期的起始日期
+
+    :param zf: zipfile.ZipFile
+    :return: {'sheets': [{'name', 'state', 'path'}, ...], 'shared_strings', 'styles', 'epoch'}
+    """
+    targets = {}
+    workbook = {'shared_strings': SHARED_STRINGS_PATH, 'styles': STYLES_PATH, 'epoch': CALENDAR_WINDOWS_1900}
+    if WORKBOOK_RELS_PATH in zf.NameToInfo:
+        with zf.open(WORKBOOK_RELS_PATH) as f:
+            for rel in ET.parse(f).getroot():
+                target = rel.get('Target', '')
+                target = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+                targets[rel.get('Id')] = target
+                rel_type = rel.get('Type', '')
+                if rel_type.endswith('/sharedStrings'):
+                    workbook['shared_strings'] = target
+                elif rel_type.endswith('/styles'):
+                    workbook['styles'] = target
+
+    sheets = []
+    with zf.open(WORKBOOK_PATH) as f:
+        for elem in ET.parse(f).getroot().iter():
+            tag = _local(elem.tag)
+            if tag == 'workbookPr' and elem.get('date1904') in ('1', 'true'):
+                workbook['epoch'] = CALENDAR_MAC_1904
+            if tag != 'sheet':
+                continue
+            rel_id = next((value for key, value in elem.attrib.items() if _local(key) == 'id'), None)
+            sheets.append({
+                'name': elem.get('name'),
+                'state': elem.get('state', 'visible'),
+                'path': targets.get(rel_id),
+            })
+    workbook['sheets'] = sheets
+    return workbook
+
+
+def _read_date_styles(zf, path):
+    """
+    读取日期格式的样式，和 openpyxl 一样数字使用这些样式的时候转换为日期（或者时间间隔）
+
+    :return: (日期样式序号的集合, 时间间隔样式序号的集合)
+    """
+    date_styles, timedelta_styles = set(), set()
+    if path not in zf.NameToInfo:
+        return date_styles, timedelta_styles
+
+    with zf.open(path) as f:
+        root = ET.parse(f).getroot()
+    custom = {}
+    for elem in root.iter():
+        if _local(elem.tag) == 'numFmt':
+            custom[int(elem.get('numFmtId'))] = elem.get('formatCode')
+    for elem in root:
+        if _local(elem.tag) != 'cellXfs':
+            continue
+        for index, xf in enumerate(elem):
+            num_fmt_id = int(xf.get('numFmtId', 0))
+            fmt = custom[num_fmt_id] if num_fmt_id in custom else builtin_format_code(num_fmt_id)
+            if is_date_format(fmt):
+                date_styles.add(index)
+            if is_timedelta_format(fmt):
+                timedelta_styles.add(index)
+    return date_styles, timedelta_styles
+
+
+def _read_sheet_head(zf, path):
+    """
+    流式读取表格的范围（<dimension> 在 <sheetData> 前面）和第一行，读到第一个 <row> 结束就停止，
+    和 pandas 一样第一行没有内容的时候标题是空的
+
+    :return: (范围, [{'column', 'ref', 'type', 'style', 'value', 'formula'}, ...])，
+             type 是 <c> 的 t 属性，共享文字的 value 是序号，formula 是 <f> 的 (内容, t, si) 或者 None
+    """
+    dimension = None
+    cells = []
+    with zf.open(path) as f:
+        for _, elem in ET.iterparse(f):
+            tag = _local(elem.tag)
+            if tag == 'dimension':
+                dimension = elem.get('ref')
+            elif tag == 'c':
+                cell = {'type': elem.get('t', 'n'), 'style': int(elem.get('s', 0)), 'value': None, 'formula': None}
+                for child in elem:
+                    child_tag = _local(child.tag)
+                    if child_tag == 'v':
+                        cell['value'] = child.text or None
+                    elif child_tag == 'is':
+                        cell['value'] = _text(child)
+                    elif child_tag == 'f':
+                        cell['formula'] = (child.text, child.get('t'), child.get('si'))
+                ref = elem.get('r')
+                cell['column'] = _column_index(ref) if ref else (cells[-1]['column'] + 1 if cells else 0)
+                cell['ref'] = ref
+                cells.append(cell)
+            elif tag == 'row':
+                if elem.get('r', '1') != '1':
+                    cells = []
+                break
+            elif tag == 'sheetData':
+                break
+    return dimension, cells
+
+
+def _read_shared_strings(zf, path, indexes):
+    """
+    读取需要的共享文字，读到最大的序号就停止
+
+    :param indexes: 需要的序号集合
+    :return: {序号: 文字}
+    """
+    strings = {}
+    if not indexes or path not in zf.NameToInfo:
+        return strings
+
+    max_index = max(indexes)
+    index = 0
+    with zf.open(path) as f:
+        for _, elem in ET.iterparse(f):
+            if _local(elem.tag) != 'si':
+                continue
+            if index in indexes:
+                strings[index] = _text(elem)
+            elem.clear()
+            if index >= max_index:
+                break
+            index += 1
+    return strings
+
+
+def _cell_value(cell, shared_strings, date_styles, timedelta_styles, epoch, data_only, shared_formulae):
+    """
+    转换单元格内容，和 openpyxl 读取的内容相同：
+    data_only 为 False 的时候公式返回 '=' 开头的文字（共享公式会转换位置，数组公式也返回文字），
+    为 True 的时候返回保存的计算结果；日期格式的数字转换为 datetime
+    """
+    cell_type, value = cell['type'], cell['value']
+    if not data_only and cell['formula'] is not None:
+        text, formula_type, si = cell['formula']
+        value = '=' + (text or '')
+        if formula_type == 'shared':
+            if si in shared_formulae:
+                value = shared_formulae[si].translate_formula(cell['ref'])
+            elif value != '=':
+                shared_formulae[si] = Translator(value, cell['ref'])
+        return value
+
+    if value is None:
+        return None
+    if cell_type == 'n':
+        value = float(value) if re.search(r'[.eE]', value) else int(value)
+        if cell['style'] in date_styles:
+            try:
+                value = from_excel(value, epoch, timedelta=cell['style'] in timedelta_styles)
+            except (OverflowError, ValueError):
+                value = '#VALUE!'
+        return value
+    if cell_type == 's':
+        return shared_strings.get(int(value))
+    if cell_type == 'b':
+        return bool(int(value))
+    if cell_type == 'd':
+        return from_ISO8601(value)
+    return value
+
+
+def probe_workbook(file, sheet_names=None, read_sheet_head=True, data_only=True):
+    """
+    读取工作簿的表格名字、状态、行数、列数和标题行，不加载工作簿，大文件也只需要几毫秒
+
+    行数和列数来自表格的 <dimension>，和 openpyxl 的只读模式相同，没有 <dimension> 的时候为 None。
+    标题行的内容和 openpyxl 读取的相同（日期格式的数字转换为 datetime），
+    只是数组公式返回 '=' 开头的文字，不是 ArrayFormula
+
+    :param file: xlsx 文件
+    :param sheet_names: 要读取的表格名字列表，默认全部表格
+    :param read_sheet_head: 读取表格的范围和标题行，为 False 的时候只读取 xl/workbook.xml（表格名字和状态）
+    :param data_only: 公式单元格返回保存的计算结果（和 pandas 读取的相同），为 False 的时候返回公式
+                      （和 load_workbook 默认的相同）
+    :return: {sheet_name: {'index', 'sheet_name', 'sheet_state', 'max_row', 'max_column', 'columns'}, }，
+             columns 中间空的单元格为 None
+    """
+    data = {}
+    with zipfile.ZipFile(file) as zf:
+        workbook = _read_workbook(zf)
+
+        heads = {}
+        for index, sheet in enumerate(workbook['sheets']):
+            if sheet_names is not None and sheet['name'] not in sheet_names:
+                continue
+            if read_sheet_head:
+                heads[sheet['name']] = _read_sheet_head(zf, sheet['path'])
+            data[sheet['name']] = {
+                'index': index,
+                'sheet_name': sheet['name'],
+                'sheet_state': sheet['state'],
+                'max_row': None,
+                'max_column': None,
+                'columns': None,
+            }
+
+        cells = [cell for _, sheet_cells in heads.values() for cell in sheet_cells]
+        indexes = {int(cell['value']) for cell in cells if cell['type'] == 's' and cell['value'] is not None}
+        shared_strings = _read_shared_strings(zf, workbook['shared_strings'], indexes)
+        # 只有标题行中有使用样式的数字的时候才读取样式
+        if any(cell['type'] == 'n' and cell['style'] for cell in cells):
+            date_styles, timedelta_styles = _read_date_styles(zf, workbook['styles'])
+        else:
+            date_styles, timedelta_styles = set(), set()
+
+    for name, (dimension, sheet_cells) in heads.items():
+        shared_formulae = {}
+        values = [(cell['column'], _cell_value(cell, shared_strings, date_styles, timedelta_styles, workbook['epoch'],
+                                               data_only, shared_formulae)) for cell in sheet_cells]
+        values = [(column, value) for column, value in values if value is not None]
+        columns = [None] * (max(column for column, _ in values) + 1 if values else 0)
+        for column, value in values:
+            columns[column] = value
+        max_row, max_column = _parse_dimension(dimension)
+        data[name].update(max_row=max_row, max_column=max_column, columns=columns)
+    return data
+
+
+def read_sheet_headers(file, sheet_names=None):
+    """
+    读取表格的标题行（第一行），不解析表格的其他内容
+
+    返回的是单元格的内容，空的和重复的标题和 pandas 的列名不同，参考 ilds.pd.read.get_read_excel_columns
+
+    :param file: xlsx 文件
+    :param sheet_names: 要读取的表格名字列表，默认全部表格
+    :return: {sheet_name: [标题, ...]}，中间空的单元格为 None
+    """
+    return {name: info['columns'] for name, info in probe_workbook(file, sheet_names).items()}